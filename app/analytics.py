@@ -0,0 +1,80 @@
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from app.services import StorageService
+
+SCHOLARSHIP_METRICS = ['scholarshipAmount', 'workedDays']
+
+class ColumnarView:
+    """Cópia colunar (DataFrame) dos registros de um serviço.
+
+    O DataFrame é montado uma vez e reaproveitado enquanto a ``version`` do
+    serviço não mudar; qualquer escrita no serviço invalida o cache. Células
+    numéricas vazias viram ``NaN`` e ficam fora das agregações.
+    """
+
+    def __init__(self, service: StorageService):
+        self.service = service
+        self._frame: Optional[pd.DataFrame] = None
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def frame(self) -> pd.DataFrame:
+        version = self.service.version
+        with self._lock:
+            if self._frame is None or self._version != version:
+                frame = pd.DataFrame.from_records(list(self.service.iter_rows()),
+                                                  columns=self.service.fieldnames)
+                fields = self.service.schema.model_fields
+                for name in self.service.fieldnames:
+                    if name in fields and fields[name].annotation in (int, float):
+                        frame[name] = pd.to_numeric(frame[name], errors='coerce')
+                self._frame = frame
+                self._version = version
+            return self._frame
+
+def scholarship_stats(frame: pd.DataFrame, group_by: Optional[str] = None,
+                      percentiles: Sequence[float] = (50, 90)) -> List[Dict[str, Any]]:
+    """Total, média e percentis de ``scholarshipAmount`` e ``workedDays``.
+
+    Com ``group_by`` o resultado tem uma entrada por valor da coluna; sem ele,
+    uma única entrada com ``group`` nulo.
+    """
+    if frame.empty:
+        return []
+    # percentis repetidos duplicariam o índice de ``quantile``
+    percentiles = list(dict.fromkeys(percentiles))
+    keys = frame[group_by] if group_by else pd.Series(0, index=frame.index)
+    grouped = frame[SCHOLARSHIP_METRICS].groupby(keys, sort=True)
+    aggregates = grouped.agg(['count', 'sum', 'mean'])
+    quantiles = grouped.quantile([p / 100 for p in percentiles])
+    result = []
+    for key in aggregates.index:
+        entry: Dict[str, Any] = {
+            'group': key if group_by else None,
+            'count': int(aggregates.loc[key, ('scholarshipAmount', 'count')]),
+        }
+        for metric in SCHOLARSHIP_METRICS:
+            entry[metric] = {
+                'total': float(aggregates.loc[key, (metric, 'sum')]),
+                'mean': float(aggregates.loc[key, (metric, 'mean')]),
+                'percentiles': {f'p{p:g}': float(quantiles.loc[(key, p / 100), metric]) for p in percentiles},
+            }
+        result.append(entry)
+    return result
+
+def age_histogram(frame: pd.DataFrame, bins: int = 10) -> List[Dict[str, Any]]:
+    """Histograma de idades em ``bins`` faixas de mesma largura."""
+    if frame.empty:
+        return []
+    ages = frame['age'].dropna().to_numpy()
+    if not len(ages):
+        return []
+    counts, edges = np.histogram(ages, bins=bins)
+    return [
+        {'start': float(edges[i]), 'end': float(edges[i + 1]), 'count': int(count)}
+        for i, count in enumerate(counts)
+    ]
@@ -0,0 +1,110 @@
+import gzip
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import Request, Response
+from pydantic_core import to_json
+
+from app.metrics import metrics
+from app.services import StorageService
+
+# Corpos menores que isso não compensam a compressão.
+GZIP_MIN_SIZE = 1024
+
+Produce = Callable[[], Awaitable[Tuple[Any, Dict[str, str]]]]
+
+class ResponseCache:
+    """Corpos de resposta já serializados (e comprimidos), por URL e codificação.
+
+    Cada entrada guarda a revisão do serviço em que foi gerada; quando a
+    revisão muda (qualquer escrita), a entrada deixa de valer e é descartada
+    na próxima consulta. As URLs menos usadas são descartadas quando há mais
+    de ``max_entries`` entradas ou os corpos somam mais de ``max_bytes``.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Tuple[str, str, bool], Tuple[str, bytes, Dict[str, str]]]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str, bool], revision: str) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != revision:
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def put(self, key: Tuple[str, str, bool], revision: str, body: bytes, headers: Dict[str, str]):
+        with self._lock:
+            self._discard(key)
+            if len(body) > self.max_bytes:
+                return
+            self._entries[key] = (revision, body, headers)
+            self._size += len(body)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _discard(self, key: Tuple[str, str, bool]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+def _not_modified(request: Request, etag: str, modified: float) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags or f'W/{etag}' in tags
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is not None:
+        try:
+            return int(modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+async def conditional_response(request: Request, service: StorageService, cache: ResponseCache,
+                               produce: Produce, tag: Optional[str] = None) -> Response:
+    """Resposta JSON com ``ETag``/``Last-Modified``, 304 e cache de corpos.
+
+    ``produce`` só é chamado quando o corpo não está no cache; devolve o
+    conteúdo e cabeçalhos extras (ex.: ``X-Next-Cursor``), guardados junto.
+    ``tag`` entra no ``ETag`` para distinguir a representação (ex.: o
+    studentId de uma busca) das demais respostas do mesmo serviço.
+    """
+    revision, modified = await service.revision_async()
+    compress = 'gzip' in request.headers.get('accept-encoding', '')
+    version = f'{quote(tag, safe="")}.{revision}' if tag is not None else revision
+    etag = f'"{version}-gzip"' if compress else f'"{version}"'
+    headers = {
+        'ETag': etag,
+        'Last-Modified': formatdate(modified, usegmt=True),
+        'Vary': 'Accept-Encoding',
+    }
+    route = request.scope['route'].path
+    if _not_modified(request, etag, modified):
+        metrics.inc('http_cache_total', route=route, result='not_modified')
+        return Response(status_code=304, headers=headers)
+    key = (request.url.path, request.url.query, compress)
+    cached = cache.get(key, revision)
+    if cached is not None:
+        metrics.inc('http_cache_total', route=route, result='hit')
+        body, extra = cached
+    else:
+        metrics.inc('http_cache_total', route=route, result='miss')
+        content, extra = await produce()
+        body = to_json(content)
+        if compress and len(body) >= GZIP_MIN_SIZE:
+            body = gzip.compress(body, compresslevel=6)
+            extra = {**extra, 'Content-Encoding': 'gzip'}
+        cache.put(key, revision, body, extra)
+    return Response(body, media_type='application/json', headers={**headers, **extra})
@@ -0,0 +1,107 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+def is_missing(value: Any) -> bool:
+    """Célula vazia (ex.: campo numérico em branco no CSV), que não é
+    comparável com os demais valores do campo."""
+    return value is None or value == ''
+
+class HashIndex:
+    """Índice de igualdade: valor do campo -> conjunto de studentIds."""
+
+    def __init__(self, field: str):
+        self.field = field
+        self._ids: Dict[Any, Set[str]] = {}
+
+    def add(self, studentId: str, value: Any):
+        self._ids.setdefault(value, set()).add(studentId)
+
+    def remove(self, studentId: str, value: Any):
+        ids = self._ids.get(value)
+        if ids is not None:
+            ids.discard(studentId)
+            if not ids:
+                del self._ids[value]
+
+    def clear(self):
+        self._ids.clear()
+
+    def rebuild(self, studentIds: Iterable[str], values: Iterable[Any]):
+        """Substitui o conteúdo (``values`` na mesma ordem de ``studentIds``)."""
+        self._ids.clear()
+        for studentId, value in zip(studentIds, values):
+            self._ids.setdefault(value, set()).add(studentId)
+
+    def equal(self, value: Any) -> Set[str]:
+        return set(self._ids.get(value, ()))
+
+    def count_equal(self, value: Any) -> int:
+        return len(self._ids.get(value, ()))
+
+class SortedIndex:
+    """Índice ordenado por valor do campo, para faixas e prefixos (busca binária).
+
+    Valores ausentes (``is_missing``) ficam fora do índice: não atendem a
+    nenhuma faixa nem prefixo.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self._entries: List[tuple] = []
+
+    def add(self, studentId: str, value: Any):
+        if not is_missing(value):
+            insort(self._entries, (value, studentId))
+
+    def remove(self, studentId: str, value: Any):
+        if is_missing(value):
+            return
+        i = bisect_left(self._entries, (value, studentId))
+        if i < len(self._entries) and self._entries[i] == (value, studentId):
+            del self._entries[i]
+
+    def clear(self):
+        self._entries.clear()
+
+    def rebuild(self, studentIds: Iterable[str], values: Iterable[Any]):
+        """Substitui o conteúdo com uma única ordenação, em vez de uma inserção
+        ordenada por item (``values`` na mesma ordem de ``studentIds``)."""
+        self._entries = sorted((value, studentId) for studentId, value in zip(studentIds, values)
+                               if not is_missing(value))
+
+    def _between(self, low: Optional[Any], high: Optional[Any]) -> Tuple[int, int]:
+        start = 0 if low is None else bisect_left(self._entries, (low,))
+        if high is None:
+            end = len(self._entries)
+        else:
+            # Compara apenas o valor: qualquer (high, id) fica dentro da faixa.
+            end = bisect_right(self._entries, high, lo=start, key=lambda entry: entry[0])
+        return start, end
+
+    def between(self, low: Optional[Any] = None, high: Optional[Any] = None) -> Set[str]:
+        """studentIds com ``low <= valor <= high`` (limites ``None`` são abertos)."""
+        start, end = self._between(low, high)
+        return {studentId for _, studentId in self._entries[start:end]}
+
+    def count_between(self, low: Optional[Any] = None, high: Optional[Any] = None) -> int:
+        start, end = self._between(low, high)
+        return end - start
+
+    def following(self, value: Any) -> Iterator[str]:
+        """studentIds com valor maior que ``value``, em ordem de valor, sob
+        demanda (o índice não pode mudar durante a iteração)."""
+        entries = self._entries
+        start = bisect_right(entries, value, key=lambda entry: entry[0])
+        return (entries[i][1] for i in range(start, len(entries)))
+
+    def _prefix(self, prefix: str) -> Tuple[int, int]:
+        start = bisect_left(self._entries, (prefix,))
+        return start, bisect_left(self._entries, (prefix + '\U0010ffff',), lo=start)
+
+    def prefix(self, prefix: str) -> Set[str]:
+        start, end = self._prefix(prefix)
+        return {studentId for _, studentId in self._entries[start:end]}
+
+    def count_prefix(self, prefix: str) -> int:
+        start, end = self._prefix(prefix)
+        return end - start
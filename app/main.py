@@ -1,11 +1,25 @@
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Body, File, Query, Request, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from starlette.concurrency import run_in_threadpool
 from app.model.student import Student
 from app.model.undergraduate_student import UndergraduateStudent
 from app.model.scientific_initiation_student import ScientificInitiationStudent
 from app.model.post_graduate_student import PostGraduateStudent
-from app.services import CSVService
-from typing import List
+from app.services import (ChangesExpiredError, DuplicateStudentError, StorageService, StudentFilter,
+                          StudentNotFoundError, create_service)
+from app.analytics import ColumnarView, age_histogram, scholarship_stats
+from app.registry import StudentRegistry
+from app.metrics import SamplingProfiler, metrics, profile_filename
+from app.http_cache import ResponseCache, conditional_response
+from app.transfer import ImportResult, export_csv, field_problems, stage_csv
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+import json
 import os
+import random
+import threading
+import time
 
 app = FastAPI(
     title="Student Management API",
@@ -13,37 +27,245 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# CSV file paths
-data_dir = os.path.join(os.path.dirname(__file__), '../data')
+# Profiling opcional: com PROFILE_SLOW_MS definido, uma fração (PROFILE_SAMPLE_RATE)
+# das requisições é amostrada e as que passarem do limite têm as pilhas
+# gravadas em PROFILE_DIR.
+profile_slow_ms = float(os.environ['PROFILE_SLOW_MS']) if os.getenv('PROFILE_SLOW_MS') else None
+profile_sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', '0.1'))
+profile_dir = os.getenv('PROFILE_DIR', 'profiles')
+profile_lock = threading.Lock()
+
+@app.middleware('http')
+async def record_metrics(request: Request, call_next):
+    """Registra contagem e latência por rota e, se habilitado, amostra requisições lentas."""
+    profiler = None
+    # Um perfil por vez: o amostrador vê todas as threads do processo.
+    if profile_slow_ms is not None and random.random() < profile_sample_rate and profile_lock.acquire(blocking=False):
+        profiler = SamplingProfiler().__enter__()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        route = request.scope.get('route')
+        path = route.path if route is not None else 'unmatched'
+        metrics.inc('http_requests_total', method=request.method, route=path, status=str(status))
+        metrics.observe('http_request_duration_seconds', elapsed, method=request.method, route=path)
+        if profiler is not None:
+            profiler.__exit__(None, None, None)
+            profile_lock.release()
+            if elapsed * 1000 >= profile_slow_ms:
+                os.makedirs(profile_dir, exist_ok=True)
+                profiler.dump(profile_filename(profile_dir, request.method, path, elapsed))
+
+# Data directory and storage backend ("csv" or "sqlite")
+data_dir = os.getenv('DATA_DIR', os.path.join(os.path.dirname(__file__), '../data'))
 os.makedirs(data_dir, exist_ok=True)
+storage_backend = os.getenv('STORAGE_BACKEND', 'csv')
 
-student_service = CSVService(
-    os.path.join(data_dir, 'students.csv'),
+student_service = create_service(
+    storage_backend, data_dir, 'students',
     Student,
     ['name', 'age', 'studentId']
 )
-undergrad_service = CSVService(
-    os.path.join(data_dir, 'undergraduates.csv'),
+undergrad_service = create_service(
+    storage_backend, data_dir, 'undergraduates',
     UndergraduateStudent,
     ['name', 'age', 'studentId', 'major']
 )
-scientific_service = CSVService(
-    os.path.join(data_dir, 'scientifics.csv'),
+scientific_service = create_service(
+    storage_backend, data_dir, 'scientifics',
     ScientificInitiationStudent,
     ['name', 'age', 'studentId', 'major', 'workedDays', 'scholarshipAmount']
 )
-postgrad_service = CSVService(
-    os.path.join(data_dir, 'postgraduates.csv'),
+postgrad_service = create_service(
+    storage_backend, data_dir, 'postgraduates',
     PostGraduateStudent,
     ['name', 'age', 'studentId', 'thesisTitle', 'supervisor', 'workedDays', 'scholarshipAmount']
 )
 
+# Registro global de studentIds: um ID pertence a um único tipo de estudante
+registry = StudentRegistry()
+registry.register('students', student_service)
+registry.register('undergraduates', undergrad_service)
+registry.register('scientifics', scientific_service)
+registry.register('postgraduates', postgrad_service)
+
+# Corpos JSON já serializados das listagens e buscas, invalidados a cada escrita
+response_cache = ResponseCache()
+
+scientific_columns = ColumnarView(scientific_service)
+postgrad_columns = ColumnarView(postgrad_service)
+
+def check_percentiles(percentiles: List[float]):
+    if any(p < 0 or p > 100 for p in percentiles):
+        raise HTTPException(status_code=422, detail='Percentis devem estar entre 0 e 100')
+
+def conflict(e: DuplicateStudentError, message: str) -> HTTPException:
+    if e.resource is not None:
+        return HTTPException(status_code=400, detail=f'studentId já cadastrado em {e.resource}: {e.studentId}')
+    return HTTPException(status_code=400, detail=f'{message}: {e.studentId}')
+
+async def list_response(service: StorageService, request: Request, limit: Optional[int], cursor: Optional[str], stream: bool,
+                        filters: Optional[StudentFilter] = None):
+    """Monta a resposta paginada (ou em streaming NDJSON) das listagens.
+
+    O cursor da próxima página (posição do último item entregue) é devolvido
+    no cabeçalho ``X-Next-Cursor``. As respostas paginadas levam
+    ``ETag``/``Last-Modified`` e vêm do cache enquanto o serviço não muda.
+    """
+    if stream:
+        try:
+            items = service.iter_items(cursor, limit, filters)
+        except ValueError:
+            raise HTTPException(status_code=422, detail='Cursor inválido')
+        lines = (json.dumps(item.dict(), ensure_ascii=False) + '\n' for item in items)
+        return StreamingResponse(lines, media_type='application/x-ndjson')
+
+    async def produce():
+        try:
+            items, next_cursor = await service.page_async(cursor, limit, filters)
+        except ValueError:
+            raise HTTPException(status_code=422, detail='Cursor inválido')
+        return items, ({'X-Next-Cursor': next_cursor} if next_cursor is not None else {})
+
+    return await conditional_response(request, service, response_cache, produce)
+
+async def item_response(service: StorageService, request: Request, studentId: str, not_found: str):
+    """Busca por studentId com ``ETag``/``Last-Modified`` e cache, como as listagens.
+
+    A existência é verificada antes dos cabeçalhos condicionais: um studentId
+    inexistente é 404 mesmo que o serviço não tenha mudado.
+    """
+    if not await service.get_async(studentId):
+        raise HTTPException(status_code=404, detail=not_found)
+
+    async def produce():
+        item = await service.get_async(studentId)
+        if not item:
+            raise HTTPException(status_code=404, detail=not_found)
+        return item, {}
+
+    return await conditional_response(request, service, response_cache, produce, tag=studentId)
+
+async def import_response(resource: str, service: StorageService, file: UploadFile):
+    """Importa um CSV enviado via multipart numa única escrita (insere ou substitui).
+
+    O arquivo é lido e validado em blocos, no executor e antes de qualquer
+    lock, e os itens válidos ficam num arquivo temporário; só os erros e os
+    studentIds ficam em memória. Depois os blocos entram numa única escrita,
+    como registros ``upsert_many``. Linhas inválidas, repetidas ou com
+    studentId de outro tipo são descartadas e listadas em ``errors``; um
+    cabeçalho incompleto ou um arquivo fora de UTF-8 cancelam a importação
+    inteira.
+    """
+    def check(item):
+        owner = registry.lookup(item.studentId, sync=False)
+        if owner is not None and owner != resource:
+            return f'studentId já cadastrado em {owner}: {item.studentId}'
+        return None
+
+    result = ImportResult()
+    try:
+        staged = await run_in_threadpool(stage_csv, file.file, service.schema, service.fieldnames, result, check)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    try:
+        await registry.sync_async()
+        with registry.claim(resource, staged.studentIds):
+            created, updated = await service.bulk_upsert_chunks_async(staged.chunks())
+    except DuplicateStudentError as e:
+        raise conflict(e, 'studentId duplicado')
+    finally:
+        staged.close()
+    return {'created': created, 'updated': updated, 'errorCount': result.error_count, 'errors': result.errors}
+
+@lru_cache(maxsize=None)
+def field_adapter(annotation: Any) -> TypeAdapter:
+    return TypeAdapter(annotation)
+
+def parse_patch(schema: Any, fields: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """Converte os campos de um patch parcial pelos tipos do schema e aplica as
+    regras dos handlers; devolve os valores convertidos e os erros."""
+    values, errors = {}, []
+    for name, value in fields.items():
+        info = schema.model_fields.get(name)
+        if info is None or name == 'studentId':
+            errors.append(f'{name}: não pode ser alterado em lote')
+            continue
+        try:
+            values[name] = field_adapter(info.annotation).validate_python(value)
+        except ValidationError as e:
+            errors.extend(f'{name}: {error["msg"]}' for error in e.errors())
+    if not fields:
+        errors.append('nenhum campo para alterar')
+    return values, errors + field_problems(schema, values)
+
+async def patch_batch_response(service: StorageService, items: Optional[List[Dict[str, Any]]],
+                               fields: Optional[Dict[str, Any]], filters: StudentFilter):
+    """Altera vários registros numa única escrita, com todos os patches validados antes.
+
+    ``items`` traz o studentId e os campos a alterar de cada registro (se algum
+    não existir, nada é alterado e a resposta é 404); ``fields`` é aplicado a
+    todos os registros que atendem os filtros da query.
+    """
+    if (items is None) == (fields is None) or (items is not None and filters):
+        raise HTTPException(status_code=422, detail='Envie "items" ou "fields" com ao menos um filtro na query')
+    if items is not None:
+        patches, errors = {}, []
+        for item in items:
+            studentId = item.get('studentId')
+            if not isinstance(studentId, str) or not studentId:
+                raise HTTPException(status_code=422, detail='studentId é obrigatório para todos os itens')
+            if studentId in patches:
+                raise HTTPException(status_code=400, detail=f'Duplicidade de studentId no batch: {studentId}')
+            patches[studentId], problems = parse_patch(service.schema, {k: v for k, v in item.items() if k != 'studentId'})
+            errors.extend(f'{studentId}: {problem}' for problem in problems)
+        if errors:
+            raise HTTPException(status_code=422, detail=errors)
+        try:
+            updated = await service.bulk_patch_async(patches)
+        except StudentNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+    else:
+        if not filters:
+            raise HTTPException(status_code=422, detail='Informe ao menos um filtro na query para alterar em lote')
+        values, errors = parse_patch(service.schema, fields)
+        if errors:
+            raise HTTPException(status_code=422, detail=errors)
+        updated = await service.bulk_patch_where_async(filters, values)
+    return {'updated': len(updated), 'studentIds': updated}
+
+async def delete_batch_response(service: StorageService, studentIds: Optional[List[str]], filters: StudentFilter):
+    """Remove numa única escrita os ``studentIds`` dados (todos ou nenhum; 404 se
+    algum não existir) ou os registros que atendem os filtros da query."""
+    if (studentIds is None) == (not filters):
+        raise HTTPException(status_code=422, detail='Envie "studentIds" ou ao menos um filtro na query')
+    try:
+        if studentIds is not None:
+            deleted = await service.bulk_delete_async(studentIds)
+        else:
+            deleted = await service.bulk_delete_where_async(filters)
+    except StudentNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {'deleted': len(deleted), 'studentIds': deleted}
+
+def export_response(resource: str, service: StorageService) -> StreamingResponse:
+    # O seq lido antes da exportação: retomar o feed dele pode reaplicar
+    # alterações já exportadas, mas nunca perde nenhuma.
+    return StreamingResponse(export_csv(service), media_type='text/csv; charset=utf-8',
+                             headers={'Content-Disposition': f'attachment; filename="{resource}.csv"',
+                                      'X-Change-Seq': str(service.seq)})
+
 # CRUD for Student
 @app.post('/students/', response_model=Student, summary="Criar estudante", description="Cria um novo estudante. O campo studentId deve ser único.",
           response_description="Estudante criado com sucesso.",
           tags=["Student"],
           )
-def create_student(student: Student):
+async def create_student(student: Student):
     """Exemplo de body:
     {
       "name": "João Silva",
@@ -55,20 +277,24 @@ def create_student(student: Student):
         raise HTTPException(status_code=422, detail='Nome e studentId são obrigatórios')
     if student.age < 0:
         raise HTTPException(status_code=422, detail='Idade não pode ser negativa')
-    if student_service.get(student.studentId):
+    if await student_service.get_async(student.studentId):
         raise HTTPException(status_code=400, detail='Student already exists')
-    student_service.add(student)
+    await registry.sync_async()
+    try:
+        with registry.claim('students', [student.studentId]):
+            await student_service.add_async(student)
+    except DuplicateStudentError as e:
+        raise conflict(e, 'Student já existe')
     return student
 
 @app.post('/students/batch', response_model=List[Student], summary="Criar estudantes em lote", tags=["Student"])
-def create_students_batch(students: List[Student] = Body(...)):
+async def create_students_batch(students: List[Student] = Body(...)):
     """Cria vários estudantes de uma vez. Exemplo de body:
     [
       {"name": "João Silva", "age": 20, "studentId": "S123"},
       {"name": "Maria Souza", "age": 21, "studentId": "S124"}
     ]
     """
-    created = []
     ids = set()
     for student in students:
         if not student.name or not student.studentId:
@@ -77,45 +303,82 @@ def create_students_batch(students: List[Student] = Body(...)):
             raise HTTPException(status_code=422, detail='Idade não pode ser negativa para todos os estudantes')
         if student.studentId in ids:
             raise HTTPException(status_code=400, detail=f'Duplicidade de studentId no batch: {student.studentId}')
-        if student_service.get(student.studentId):
-            raise HTTPException(status_code=400, detail=f'Student já existe: {student.studentId}')
         ids.add(student.studentId)
-        student_service.add(student)
-        created.append(student)
-    return created
+    await registry.sync_async()
+    try:
+        with registry.claim('students', ids):
+            await student_service.bulk_add_async(students)
+    except DuplicateStudentError as e:
+        raise conflict(e, 'Student já existe')
+    return students
 
 @app.get('/students/', response_model=List[Student], summary="Listar estudantes", tags=["Student"])
-def list_students():
-    """Retorna todos os estudantes cadastrados."""
-    return student_service.read_all()
+async def list_students(request: Request, limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None, stream: bool = False, min_age: Optional[int] = None, max_age: Optional[int] = None, name_prefix: Optional[str] = None):
+    """Retorna os estudantes cadastrados.
+
+    Use ``limit`` e ``cursor`` (valor do cabeçalho ``X-Next-Cursor``) para paginar
+    e ``stream=true`` para receber NDJSON, um estudante por linha. Os filtros
+    ``min_age``/``max_age`` e ``name_prefix`` usam índices ordenados.
+    """
+    filters = StudentFilter(ranges={'age': (min_age, max_age)}, prefixes={'name': name_prefix})
+    return await list_response(student_service, request, limit, cursor, stream, filters)
+
+@app.post('/students/import', summary="Importar estudantes de CSV", tags=["Student"])
+async def import_students(file: UploadFile = File(...)):
+    """Importa um CSV com as mesmas colunas do export; studentIds existentes são substituídos."""
+    return await import_response('students', student_service, file)
+
+@app.get('/students/export', summary="Exportar estudantes em CSV", tags=["Student"], response_class=StreamingResponse)
+def export_students():
+    return export_response('students', student_service)
+
+@app.patch('/students/batch', summary="Alterar estudantes em lote", tags=["Student"])
+async def patch_students_batch(items: Optional[List[Dict[str, Any]]] = Body(None), fields: Optional[Dict[str, Any]] = Body(None),
+                               min_age: Optional[int] = None, max_age: Optional[int] = None, name_prefix: Optional[str] = None):
+    """Altera vários estudantes numa única escrita. Exemplos de body:
+    {"items": [{"studentId": "S123", "age": 21}, {"studentId": "S124", "name": "Maria S."}]}
+    {"fields": {"age": 18}}  (com filtros na query, ex.: ?max_age=17)
+    """
+    filters = StudentFilter(ranges={'age': (min_age, max_age)}, prefixes={'name': name_prefix})
+    return await patch_batch_response(student_service, items, fields, filters)
+
+@app.delete('/students/batch', summary="Remover estudantes em lote", tags=["Student"])
+async def delete_students_batch(studentIds: Optional[List[str]] = Body(None, embed=True),
+                                min_age: Optional[int] = None, max_age: Optional[int] = None, name_prefix: Optional[str] = None):
+    """Remove vários estudantes numa única escrita: os ``studentIds`` do body
+    (ex.: {"studentIds": ["S123", "S124"]}) ou os que atendem os filtros da query."""
+    filters = StudentFilter(ranges={'age': (min_age, max_age)}, prefixes={'name': name_prefix})
+    return await delete_batch_response(student_service, studentIds, filters)
 
 @app.get('/students/{studentId}', response_model=Student, summary="Buscar estudante", tags=["Student"])
-def get_student(studentId: str):
+async def get_student(request: Request, studentId: str):
     """Busca um estudante pelo studentId."""
-    student = student_service.get(studentId)
-    if not student:
-        raise HTTPException(status_code=404, detail='Student not found')
-    return student
+    return await item_response(student_service, request, studentId, 'Student not found')
 
 @app.put('/students/{studentId}', response_model=Student, summary="Atualizar estudante", tags=["Student"])
-def update_student(studentId: str, student: Student):
+async def update_student(studentId: str, student: Student):
     """Atualiza os dados de um estudante pelo studentId."""
-    if not student_service.get(studentId):
+    if not await student_service.get_async(studentId):
         raise HTTPException(status_code=404, detail='Student not found')
-    student_service.update(studentId, student)
+    await registry.sync_async()
+    try:
+        with registry.claim('students', [student.studentId]):
+            await student_service.update_async(studentId, student)
+    except DuplicateStudentError as e:
+        raise conflict(e, 'Student já existe')
     return student
 
 @app.delete('/students/{studentId}', summary="Remover estudante", tags=["Student"])
-def delete_student(studentId: str):
+async def delete_student(studentId: str):
     """Remove um estudante pelo studentId."""
-    if not student_service.get(studentId):
+    if not await student_service.get_async(studentId):
         raise HTTPException(status_code=404, detail='Student not found')
-    student_service.delete(studentId)
+    await student_service.delete_async(studentId)
     return {'ok': True}
 
 # CRUD for UndergraduateStudent
 @app.post('/undergraduates/', response_model=UndergraduateStudent, summary="Criar undergraduate", tags=["UndergraduateStudent"])
-def create_undergraduate(student: UndergraduateStudent):
+async def create_undergraduate(student: UndergraduateStudent):
     """Exemplo de body:
     {
       "name": "Maria Souza",
@@ -128,20 +391,24 @@ def create_undergraduate(student: UndergraduateStudent):
         raise HTTPException(status_code=422, detail='Nome, studentId e major são obrigatórios')
     if student.age < 0:
         raise HTTPException(status_code=422, detail='Idade não pode ser negativa')
-    if undergrad_service.get(student.studentId):
+    if await undergrad_service.get_async(student.studentId):
         raise HTTPException(status_code=400, detail='Undergraduate already exists')
-    undergrad_service.add(student)
+    await registry.sync_async()
+    try:
+        with registry.claim('undergraduates', [student.studentId]):
+            await undergrad_service.add_async(student)
+    except DuplicateStudentError as e:
+        raise conflict(e, 'Undergraduate já existe')
     return student
 
 @app.post('/undergraduates/batch', response_model=List[UndergraduateStudent], summary="Criar undergraduates em lote", tags=["UndergraduateStudent"])
-def create_undergraduates_batch(students: List[UndergraduateStudent] = Body(...)):
+async def create_undergraduates_batch(students: List[UndergraduateStudent] = Body(...)):
     """Cria vários undergraduates de uma vez. Exemplo de body:
     [
       {"name": "Maria Souza", "age": 21, "studentId": "U456", "major": "Engenharia"},
       {"name": "Pedro Lima", "age": 22, "studentId": "U457", "major": "Matemática"}
     ]
     """
-    created = []
     ids = set()
     for student in students:
         if not student.name or not student.studentId or not student.major:
@@ -150,41 +417,66 @@ def create_undergraduates_batch(students: List[UndergraduateStudent] = Body(...)
             raise HTTPException(status_code=422, detail='Idade não pode ser negativa para todos os undergraduates')
         if student.studentId in ids:
             raise HTTPException(status_code=400, detail=f'Duplicidade de studentId no batch: {student.studentId}')
-        if undergrad_service.get(student.studentId):
-            raise HTTPException(status_code=400, detail=f'Undergraduate já existe: {student.studentId}')
         ids.add(student.studentId)
-        undergrad_service.add(student)
-        created.append(student)
-    return created
+    await registry.sync_async()
+    try:
+        with registry.claim('undergraduates', ids):
+            await undergrad_service.bulk_add_async(students)
+    except DuplicateStudentError as e:
+        raise conflict(e, 'Undergraduate já existe')
+    return students
 
 @app.get('/undergraduates/', response_model=List[UndergraduateStudent], summary="Listar undergraduates", tags=["UndergraduateStudent"])
-def list_undergraduates():
-    return undergrad_service.read_all()
+async def list_undergraduates(request: Request, limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None, stream: bool = False, min_age: Optional[int] = None, max_age: Optional[int] = None, name_prefix: Optional[str] = None, major: Optional[str] = None):
+    filters = StudentFilter(equals={'major': major}, ranges={'age': (min_age, max_age)}, prefixes={'name': name_prefix})
+    return await list_response(undergrad_service, request, limit, cursor, stream, filters)
+
+@app.post('/undergraduates/import', summary="Importar undergraduates de CSV", tags=["UndergraduateStudent"])
+async def import_undergraduates(file: UploadFile = File(...)):
+    return await import_response('undergraduates', undergrad_service, file)
+
+@app.get('/undergraduates/export', summary="Exportar undergraduates em CSV", tags=["UndergraduateStudent"], response_class=StreamingResponse)
+def export_undergraduates():
+    return export_response('undergraduates', undergrad_service)
+
+@app.patch('/undergraduates/batch', summary="Alterar undergraduates em lote", tags=["UndergraduateStudent"])
+async def patch_undergraduates_batch(items: Optional[List[Dict[str, Any]]] = Body(None), fields: Optional[Dict[str, Any]] = Body(None),
+                                     min_age: Optional[int] = None, max_age: Optional[int] = None, name_prefix: Optional[str] = None, major: Optional[str] = None):
+    filters = StudentFilter(equals={'major': major}, ranges={'age': (min_age, max_age)}, prefixes={'name': name_prefix})
+    return await patch_batch_response(undergrad_service, items, fields, filters)
+
+@app.delete('/undergraduates/batch', summary="Remover undergraduates em lote", tags=["UndergraduateStudent"])
+async def delete_undergraduates_batch(studentIds: Optional[List[str]] = Body(None, embed=True),
+                                      min_age: Optional[int] = None, max_age: Optional[int] = None, name_prefix: Optional[str] = None, major: Optional[str] = None):
+    filters = StudentFilter(equals={'major': major}, ranges={'age': (min_age, max_age)}, prefixes={'name': name_prefix})
+    return await delete_batch_response(undergrad_service, studentIds, filters)
 
 @app.get('/undergraduates/{studentId}', response_model=UndergraduateStudent, summary="Buscar undergraduate", tags=["UndergraduateStudent"])
-def get_undergraduate(studentId: str):
-    student = undergrad_service.get(studentId)
-    if not student:
-        raise HTTPException(status_code=404, detail='Undergraduate not found')
-    return student
+async def get_undergraduate(request: Request, studentId: str):
+    return await item_response(undergrad_service, request, studentId, 'Undergraduate not found')
 
 @app.put('/undergraduates/{studentId}', response_model=UndergraduateStudent, summary="Atualizar undergraduate", tags=["UndergraduateStudent"])
-def update_undergraduate(studentId: str, student: UndergraduateStudent):
-    if not undergrad_service.get(studentId):
+async def update_undergraduate(studentId: str, student: UndergraduateStudent):
+    if not await undergrad_service.get_async(studentId):
         raise HTTPException(status_code=404, detail='Undergraduate not found')
-    undergrad_service.update(studentId, student)
+    await registry.sync_async()
+    try:
+        with registry.claim('undergraduates', [student.studentId]):
+            await undergrad_service.update_async(studentId, student)
+    except DuplicateStudentError as e:
+        raise conflict(e, 'Undergraduate já existe')
     return student
 
 @app.delete('/undergraduates/{studentId}', summary="Remover undergraduate", tags=["UndergraduateStudent"])
-def delete_undergraduate(studentId: str):
-    if not undergrad_service.get(studentId):
+async def delete_undergraduate(studentId: str):
+    if not await undergrad_service.get_async(studentId):
         raise HTTPException(status_code=404, detail='Undergraduate not found')
-    undergrad_service.delete(studentId)
+    await undergrad_service.delete_async(studentId)
     return {'ok': True}
 
 # CRUD for ScientificInitiationStudent
 @app.post('/scientifics/', response_model=ScientificInitiationStudent, summary="Criar scientific initiation student", tags=["ScientificInitiationStudent"])
-def create_scientific(student: ScientificInitiationStudent):
+async def create_scientific(student: ScientificInitiationStudent):
     """Exemplo de body:
     {
       "name": "Carlos Lima",
@@ -201,20 +493,24 @@ def create_scientific(student: ScientificInitiationStudent):
         raise HTTPException(status_code=422, detail='Idade e workedDays não podem ser negativas')
     if student.scholarshipAmount < 0:
         raise HTTPException(status_code=422, detail='scholarshipAmount não pode ser negativo')
-    if scientific_service.get(student.studentId):
+    if await scientific_service.get_async(student.studentId):
         raise HTTPException(status_code=400, detail='Scientific Initiation Student already exists')
-    scientific_service.add(student)
+    await registry.sync_async()
+    try:
+        with registry.claim('scientifics', [student.studentId]):
+            await scientific_service.add_async(student)
+    except DuplicateStudentError as e:
+        raise conflict(e, 'Scientific já existe')
     return student
 
 @app.post('/scientifics/batch', response_model=List[ScientificInitiationStudent], summary="Criar scientific initiation students em lote", tags=["ScientificInitiationStudent"])
-def create_scientifics_batch(students: List[ScientificInitiationStudent] = Body(...)):
+async def create_scientifics_batch(students: List[ScientificInitiationStudent] = Body(...)):
     """Cria vários scientific initiation students de uma vez. Exemplo de body:
     [
       {"name": "Carlos Lima", "age": 22, "studentId": "SI789", "major": "Computação", "workedDays": 120, "scholarshipAmount": 800.0},
       {"name": "Julia Alves", "age": 23, "studentId": "SI790", "major": "Física", "workedDays": 100, "scholarshipAmount": 700.0}
     ]
     """
-    created = []
     ids = set()
     for student in students:
         if not student.name or not student.studentId or not student.major:
@@ -225,41 +521,90 @@ def create_scientifics_batch(students: List[ScientificInitiationStudent] = Body(
             raise HTTPException(status_code=422, detail='scholarshipAmount não pode ser negativo para todos os scientifics')
         if student.studentId in ids:
             raise HTTPException(status_code=400, detail=f'Duplicidade de studentId no batch: {student.studentId}')
-        if scientific_service.get(student.studentId):
-            raise HTTPException(status_code=400, detail=f'Scientific já existe: {student.studentId}')
         ids.add(student.studentId)
-        scientific_service.add(student)
-        created.append(student)
-    return created
+    await registry.sync_async()
+    try:
+        with registry.claim('scientifics', ids):
+            await scientific_service.bulk_add_async(students)
+    except DuplicateStudentError as e:
+        raise conflict(e, 'Scientific já existe')
+    return students
 
 @app.get('/scientifics/', response_model=List[ScientificInitiationStudent], summary="Listar scientific initiation students", tags=["ScientificInitiationStudent"])
-def list_scientifics():
-    return scientific_service.read_all()
+async def list_scientifics(request: Request, limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None, stream: bool = False, min_age: Optional[int] = None, max_age: Optional[int] = None, name_prefix: Optional[str] = None, major: Optional[str] = None, min_scholarship: Optional[float] = None, max_scholarship: Optional[float] = None):
+    filters = StudentFilter(
+        equals={'major': major},
+        ranges={'age': (min_age, max_age), 'scholarshipAmount': (min_scholarship, max_scholarship)},
+        prefixes={'name': name_prefix},
+    )
+    return await list_response(scientific_service, request, limit, cursor, stream, filters)
+
+# As estatísticas continuam síncronas: montar o DataFrame é trabalho de CPU e
+# roda no threadpool, fora do event loop.
+@app.get('/scientifics/stats', summary="Estatísticas de bolsas dos scientific initiation students", tags=["ScientificInitiationStudent"])
+def scientific_stats(group_by: Optional[str] = Query(None, pattern='^major$'), percentiles: List[float] = Query([50, 90])):
+    """Total, média e percentis de scholarshipAmount e workedDays, opcionalmente agrupados por major."""
+    check_percentiles(percentiles)
+    return scholarship_stats(scientific_columns.frame(), group_by, percentiles)
+
+@app.get('/scientifics/stats/age-histogram', summary="Histograma de idades dos scientific initiation students", tags=["ScientificInitiationStudent"])
+def scientific_age_histogram(bins: int = Query(10, ge=1, le=100)):
+    return age_histogram(scientific_columns.frame(), bins)
+
+@app.post('/scientifics/import', summary="Importar scientific initiation students de CSV", tags=["ScientificInitiationStudent"])
+async def import_scientifics(file: UploadFile = File(...)):
+    return await import_response('scientifics', scientific_service, file)
+
+@app.get('/scientifics/export', summary="Exportar scientific initiation students em CSV", tags=["ScientificInitiationStudent"], response_class=StreamingResponse)
+def export_scientifics():
+    return export_response('scientifics', scientific_service)
+
+@app.patch('/scientifics/batch', summary="Alterar scientific initiation students em lote", tags=["ScientificInitiationStudent"])
+async def patch_scientifics_batch(items: Optional[List[Dict[str, Any]]] = Body(None), fields: Optional[Dict[str, Any]] = Body(None),
+                                  min_age: Optional[int] = None, max_age: Optional[int] = None, name_prefix: Optional[str] = None, major: Optional[str] = None, min_scholarship: Optional[float] = None, max_scholarship: Optional[float] = None):
+    filters = StudentFilter(
+        equals={'major': major},
+        ranges={'age': (min_age, max_age), 'scholarshipAmount': (min_scholarship, max_scholarship)},
+        prefixes={'name': name_prefix},
+    )
+    return await patch_batch_response(scientific_service, items, fields, filters)
+
+@app.delete('/scientifics/batch', summary="Remover scientific initiation students em lote", tags=["ScientificInitiationStudent"])
+async def delete_scientifics_batch(studentIds: Optional[List[str]] = Body(None, embed=True),
+                                   min_age: Optional[int] = None, max_age: Optional[int] = None, name_prefix: Optional[str] = None, major: Optional[str] = None, min_scholarship: Optional[float] = None, max_scholarship: Optional[float] = None):
+    filters = StudentFilter(
+        equals={'major': major},
+        ranges={'age': (min_age, max_age), 'scholarshipAmount': (min_scholarship, max_scholarship)},
+        prefixes={'name': name_prefix},
+    )
+    return await delete_batch_response(scientific_service, studentIds, filters)
 
 @app.get('/scientifics/{studentId}', response_model=ScientificInitiationStudent, summary="Buscar scientific initiation student", tags=["ScientificInitiationStudent"])
-def get_scientific(studentId: str):
-    student = scientific_service.get(studentId)
-    if not student:
-        raise HTTPException(status_code=404, detail='Scientific Initiation Student not found')
-    return student
+async def get_scientific(request: Request, studentId: str):
+    return await item_response(scientific_service, request, studentId, 'Scientific Initiation Student not found')
 
 @app.put('/scientifics/{studentId}', response_model=ScientificInitiationStudent, summary="Atualizar scientific initiation student", tags=["ScientificInitiationStudent"])
-def update_scientific(studentId: str, student: ScientificInitiationStudent):
-    if not scientific_service.get(studentId):
+async def update_scientific(studentId: str, student: ScientificInitiationStudent):
+    if not await scientific_service.get_async(studentId):
         raise HTTPException(status_code=404, detail='Scientific Initiation Student not found')
-    scientific_service.update(studentId, student)
+    await registry.sync_async()
+    try:
+        with registry.claim('scientifics', [student.studentId]):
+            await scientific_service.update_async(studentId, student)
+    except DuplicateStudentError as e:
+        raise conflict(e, 'Scientific já existe')
     return student
 
 @app.delete('/scientifics/{studentId}', summary="Remover scientific initiation student", tags=["ScientificInitiationStudent"])
-def delete_scientific(studentId: str):
-    if not scientific_service.get(studentId):
+async def delete_scientific(studentId: str):
+    if not await scientific_service.get_async(studentId):
         raise HTTPException(status_code=404, detail='Scientific Initiation Student not found')
-    scientific_service.delete(studentId)
+    await scientific_service.delete_async(studentId)
     return {'ok': True}
 
 # CRUD for PostGraduateStudent
 @app.post('/postgraduates/', response_model=PostGraduateStudent, summary="Criar postgraduate", tags=["PostGraduateStudent"])
-def create_postgraduate(student: PostGraduateStudent):
+async def create_postgraduate(student: PostGraduateStudent):
     """Exemplo de body:
     {
       "name": "Ana Paula",
@@ -277,20 +622,24 @@ def create_postgraduate(student: PostGraduateStudent):
         raise HTTPException(status_code=422, detail='Idade e workedDays não podem ser negativos')
     if student.scholarshipAmount < 0:
         raise HTTPException(status_code=422, detail='scholarshipAmount não pode ser negativo')
-    if postgrad_service.get(student.studentId):
+    if await postgrad_service.get_async(student.studentId):
         raise HTTPException(status_code=400, detail='PostGraduate Student already exists')
-    postgrad_service.add(student)
+    await registry.sync_async()
+    try:
+        with registry.claim('postgraduates', [student.studentId]):
+            await postgrad_service.add_async(student)
+    except DuplicateStudentError as e:
+        raise conflict(e, 'PostGraduate já existe')
     return student
 
 @app.post('/postgraduates/batch', response_model=List[PostGraduateStudent], summary="Criar postgraduates em lote", tags=["PostGraduateStudent"])
-def create_postgraduates_batch(students: List[PostGraduateStudent] = Body(...)):
+async def create_postgraduates_batch(students: List[PostGraduateStudent] = Body(...)):
     """Cria vários postgraduates de uma vez. Exemplo de body:
     [
       {"name": "Ana Paula", "age": 27, "studentId": "PG101", "thesisTitle": "Deep Learning em Saúde", "supervisor": "Dr. Silva", "workedDays": 200, "scholarshipAmount": 1500.0},
       {"name": "Lucas Costa", "age": 28, "studentId": "PG102", "thesisTitle": "IA em Robótica", "supervisor": "Dra. Souza", "workedDays": 180, "scholarshipAmount": 1400.0}
     ]
     """
-    created = []
     ids = set()
     for student in students:
         if not student.name or not student.studentId or not student.thesisTitle or not student.supervisor:
@@ -301,34 +650,115 @@ def create_postgraduates_batch(students: List[PostGraduateStudent] = Body(...)):
             raise HTTPException(status_code=422, detail='scholarshipAmount não pode ser negativo para todos os postgraduates')
         if student.studentId in ids:
             raise HTTPException(status_code=400, detail=f'Duplicidade de studentId no batch: {student.studentId}')
-        if postgrad_service.get(student.studentId):
-            raise HTTPException(status_code=400, detail=f'PostGraduate já existe: {student.studentId}')
         ids.add(student.studentId)
-        postgrad_service.add(student)
-        created.append(student)
-    return created
+    await registry.sync_async()
+    try:
+        with registry.claim('postgraduates', ids):
+            await postgrad_service.bulk_add_async(students)
+    except DuplicateStudentError as e:
+        raise conflict(e, 'PostGraduate já existe')
+    return students
 
 @app.get('/postgraduates/', response_model=List[PostGraduateStudent], summary="Listar postgraduates", tags=["PostGraduateStudent"])
-def list_postgraduates():
-    return postgrad_service.read_all()
+async def list_postgraduates(request: Request, limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None, stream: bool = False, min_age: Optional[int] = None, max_age: Optional[int] = None, name_prefix: Optional[str] = None, supervisor: Optional[str] = None, min_scholarship: Optional[float] = None, max_scholarship: Optional[float] = None):
+    filters = StudentFilter(
+        equals={'supervisor': supervisor},
+        ranges={'age': (min_age, max_age), 'scholarshipAmount': (min_scholarship, max_scholarship)},
+        prefixes={'name': name_prefix},
+    )
+    return await list_response(postgrad_service, request, limit, cursor, stream, filters)
+
+@app.get('/postgraduates/stats', summary="Estatísticas de bolsas dos postgraduates", tags=["PostGraduateStudent"])
+def postgraduate_stats(group_by: Optional[str] = Query(None, pattern='^supervisor$'), percentiles: List[float] = Query([50, 90])):
+    """Total, média e percentis de scholarshipAmount e workedDays, opcionalmente agrupados por supervisor."""
+    check_percentiles(percentiles)
+    return scholarship_stats(postgrad_columns.frame(), group_by, percentiles)
+
+@app.get('/postgraduates/stats/age-histogram', summary="Histograma de idades dos postgraduates", tags=["PostGraduateStudent"])
+def postgraduate_age_histogram(bins: int = Query(10, ge=1, le=100)):
+    return age_histogram(postgrad_columns.frame(), bins)
+
+@app.post('/postgraduates/import', summary="Importar postgraduates de CSV", tags=["PostGraduateStudent"])
+async def import_postgraduates(file: UploadFile = File(...)):
+    return await import_response('postgraduates', postgrad_service, file)
+
+@app.get('/postgraduates/export', summary="Exportar postgraduates em CSV", tags=["PostGraduateStudent"], response_class=StreamingResponse)
+def export_postgraduates():
+    return export_response('postgraduates', postgrad_service)
+
+@app.patch('/postgraduates/batch', summary="Alterar postgraduates em lote", tags=["PostGraduateStudent"])
+async def patch_postgraduates_batch(items: Optional[List[Dict[str, Any]]] = Body(None), fields: Optional[Dict[str, Any]] = Body(None),
+                                    min_age: Optional[int] = None, max_age: Optional[int] = None, name_prefix: Optional[str] = None, supervisor: Optional[str] = None, min_scholarship: Optional[float] = None, max_scholarship: Optional[float] = None):
+    filters = StudentFilter(
+        equals={'supervisor': supervisor},
+        ranges={'age': (min_age, max_age), 'scholarshipAmount': (min_scholarship, max_scholarship)},
+        prefixes={'name': name_prefix},
+    )
+    return await patch_batch_response(postgrad_service, items, fields, filters)
+
+@app.delete('/postgraduates/batch', summary="Remover postgraduates em lote", tags=["PostGraduateStudent"])
+async def delete_postgraduates_batch(studentIds: Optional[List[str]] = Body(None, embed=True),
+                                     min_age: Optional[int] = None, max_age: Optional[int] = None, name_prefix: Optional[str] = None, supervisor: Optional[str] = None, min_scholarship: Optional[float] = None, max_scholarship: Optional[float] = None):
+    filters = StudentFilter(
+        equals={'supervisor': supervisor},
+        ranges={'age': (min_age, max_age), 'scholarshipAmount': (min_scholarship, max_scholarship)},
+        prefixes={'name': name_prefix},
+    )
+    return await delete_batch_response(postgrad_service, studentIds, filters)
 
 @app.get('/postgraduates/{studentId}', response_model=PostGraduateStudent, summary="Buscar postgraduate", tags=["PostGraduateStudent"])
-def get_postgraduate(studentId: str):
-    student = postgrad_service.get(studentId)
-    if not student:
-        raise HTTPException(status_code=404, detail='PostGraduate Student not found')
-    return student
+async def get_postgraduate(request: Request, studentId: str):
+    return await item_response(postgrad_service, request, studentId, 'PostGraduate Student not found')
 
 @app.put('/postgraduates/{studentId}', response_model=PostGraduateStudent, summary="Atualizar postgraduate", tags=["PostGraduateStudent"])
-def update_postgraduate(studentId: str, student: PostGraduateStudent):
-    if not postgrad_service.get(studentId):
+async def update_postgraduate(studentId: str, student: PostGraduateStudent):
+    if not await postgrad_service.get_async(studentId):
         raise HTTPException(status_code=404, detail='PostGraduate Student not found')
-    postgrad_service.update(studentId, student)
+    await registry.sync_async()
+    try:
+        with registry.claim('postgraduates', [student.studentId]):
+            await postgrad_service.update_async(studentId, student)
+    except DuplicateStudentError as e:
+        raise conflict(e, 'PostGraduate já existe')
     return student
 
 @app.delete('/postgraduates/{studentId}', summary="Remover postgraduate", tags=["PostGraduateStudent"])
-def delete_postgraduate(studentId: str):
-    if not postgrad_service.get(studentId):
+async def delete_postgraduate(studentId: str):
+    if not await postgrad_service.get_async(studentId):
         raise HTTPException(status_code=404, detail='PostGraduate Student not found')
-    postgrad_service.delete(studentId)
+    await postgrad_service.delete_async(studentId)
     return {'ok': True}
+
+# Cross-type lookup
+@app.get('/lookup/{studentId}', summary="Localizar estudante", tags=["Lookup"])
+async def lookup_student(studentId: str):
+    """Informa a qual tipo o studentId pertence e retorna o registro, sem percorrer os arquivos."""
+    await registry.sync_async()
+    resource = registry.lookup(studentId, sync=False)
+    student = await registry.service(resource).get_async(studentId) if resource else None
+    if not student:
+        raise HTTPException(status_code=404, detail='Student not found')
+    return {'studentId': studentId, 'resource': resource, 'type': type(student).__name__, 'student': student}
+
+# Change feed for incremental sync
+@app.get('/changes', summary="Alterações de um recurso", tags=["Changes"])
+async def get_changes(resource: str = Query(..., pattern='^(students|undergraduates|scientifics|postgraduates)$'),
+                      since: int = Query(0, ge=0), limit: int = Query(1000, ge=1, le=10000)):
+    """Alterações gravadas depois de ``since``, em ordem, e o último seq (``lastSeq``).
+
+    O consumidor guarda o ``seq`` da última alteração aplicada e o envia na
+    próxima chamada; enquanto ``changes`` vier cheio (``limit`` itens), há
+    mais a buscar. Com 410 o histórico pedido já foi descartado: reexporte o
+    recurso (``/{resource}/export``, que informa o seq em ``X-Change-Seq``)
+    e continue dali.
+    """
+    try:
+        changes, last = await run_in_threadpool(registry.service(resource).changes, since, limit)
+    except ChangesExpiredError as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    return {'resource': resource, 'since': since, 'lastSeq': last, 'changes': changes}
+
+@app.get('/metrics', summary="Métricas da API", tags=["Metrics"], response_class=PlainTextResponse)
+async def get_metrics():
+    """Contagem e latência por rota e tempos/bytes do armazenamento, no formato texto do Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
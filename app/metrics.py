@@ -0,0 +1,139 @@
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+class MetricsRegistry:
+    """Contadores e histogramas em memória, exportados no formato texto do Prometheus."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str):
+        self._help[name] = ('counter', help)
+        self._counters.setdefault(name, {})
+
+    def histogram(self, name: str, help: str):
+        self._help[name] = ('histogram', help)
+        self._histograms.setdefault(name, {})
+
+    def inc(self, name: str, amount: float = 1, **labels: str):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms[name]
+            # Contagens por faixa (mais a faixa acima da última), soma e total.
+            state = series.get(key)
+            if state is None:
+                state = series[key] = [0.0] * (len(self.buckets) + 3)
+            state[bisect_left(self.buckets, value)] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, help) in sorted(self._help.items()):
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                if kind == 'counter':
+                    for labels, value in sorted(self._counters[name].items()):
+                        lines.append(f'{name}{_format_labels(labels)} {value:g}')
+                    continue
+                for labels, state in sorted(self._histograms[name].items()):
+                    cumulative = 0.0
+                    for bound, count in zip(self.buckets, state):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_format_labels(labels, ("le", f"{bound:g}"))} {cumulative:g}')
+                    lines.append(f'{name}_bucket{_format_labels(labels, ("le", "+Inf"))} {state[-1]:g}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {state[-2]:.6f}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {state[-1]:g}')
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+metrics.counter('http_requests_total', 'Requisições HTTP atendidas, por rota e status.')
+metrics.histogram('http_request_duration_seconds', 'Latência das requisições HTTP, por rota.')
+metrics.histogram('storage_phase_seconds', 'Tempo do armazenamento por recurso, operação e fase (read, parse, model, write).')
+metrics.counter('http_cache_total', 'Respostas condicionais por rota: not_modified (304), hit ou miss no cache de corpos.')
+metrics.counter('storage_bytes_total', 'Bytes lidos e gravados pelo armazenamento, por recurso, operação e direção.')
+
+class SamplingProfiler:
+    """Amostrador de pilhas para requisições lentas (opcional).
+
+    Enquanto ativo, uma thread coleta as pilhas de todas as outras threads a
+    cada ``interval`` segundos via ``sys._current_frames``. As pilhas são
+    agregadas no formato "collapsed" (uma linha ``f1;f2;f3 N`` por pilha),
+    aceito por flamegraph.pl e speedscope.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='sampling-profiler')
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def __enter__(self) -> 'SamplingProfiler':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path: str):
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+
+def profile_filename(directory: str, method: str, route: str, elapsed: float) -> str:
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+    return os.path.join(directory, f'{time.strftime("%Y%m%d-%H%M%S")}-{method}-{slug}-{elapsed * 1000:.0f}ms.collapsed')
@@ -0,0 +1,97 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from app.services import DuplicateStudentError, StorageService
+
+class StudentRegistry:
+    """Registro global studentId -> recurso, compartilhado por todos os tipos.
+
+    É montado uma vez na inicialização a partir dos serviços registrados e
+    mantido em dia pelas notificações de escrita de cada serviço, de modo que
+    ``lookup`` é O(1) e ``claim`` garante que um studentId pertence a um único
+    tipo de estudante.
+    """
+
+    def __init__(self):
+        self._owners: Dict[str, str] = {}
+        self._services: Dict[str, StorageService] = {}
+        self._lock = threading.Lock()
+
+    def register(self, resource: str, service: StorageService):
+        key = service.fieldnames.index('studentId')
+        with self._lock:
+            self._services[resource] = service
+            for row in service.iter_rows():
+                # Em dados legados com IDs repetidos entre tipos, vale o primeiro.
+                self._owners.setdefault(row[key], resource)
+        service.subscribe(lambda added, removed: self._on_change(resource, added, removed))
+
+    def _on_change(self, resource: str, added: List[str], removed: Optional[List[str]]):
+        with self._lock:
+            if removed is None:
+                # Conjunto substituído: ``added`` traz todos os studentIds atuais.
+                current = set(added)
+                removed = [studentId for studentId, owner in self._owners.items()
+                           if owner == resource and studentId not in current]
+            for studentId in removed:
+                if self._owners.get(studentId) == resource:
+                    del self._owners[studentId]
+            for studentId in added:
+                self._owners[studentId] = resource
+
+    def sync(self):
+        """Alcança as escritas de outros workers em todos os serviços.
+
+        Cada serviço avisa o registro do que mudou; quando nada mudou, custa
+        uma verificação barata por serviço. Não pode ser chamado com ``_lock``.
+        """
+        for service in list(self._services.values()):
+            service.sync()
+
+    async def sync_async(self):
+        """Como ``sync``, sem bloquear o event loop."""
+        for service in list(self._services.values()):
+            await service.sync_async()
+
+    def lookup(self, studentId: str, sync: bool = True) -> Optional[str]:
+        """Recurso que possui o studentId, ou ``None``.
+
+        Com ``sync=False`` responde do estado já conhecido (ex.: validações
+        em massa, seguidas de um ``claim``, que sincroniza).
+        """
+        if sync:
+            self.sync()
+        return self._owners.get(studentId)
+
+    def service(self, resource: str) -> StorageService:
+        return self._services[resource]
+
+    @contextmanager
+    def claim(self, resource: str, studentIds: Iterable[str]) -> Iterator[None]:
+        """Reserva os studentIds para ``resource`` durante uma escrita.
+
+        Levanta ``DuplicateStudentError`` (com ``resource`` preenchido) se algum
+        deles já pertence a outro tipo. Se a escrita falhar, as reservas novas
+        são desfeitas. Não sincroniza: chame ``sync_async`` (ou ``sync``) antes,
+        para conhecer as escritas de outros workers.
+        """
+        reserved = []
+        with self._lock:
+            for studentId in studentIds:
+                owner = self._owners.get(studentId)
+                if owner is not None and owner != resource:
+                    for done in reserved:
+                        del self._owners[done]
+                    raise DuplicateStudentError(studentId, owner)
+                if owner is None:
+                    self._owners[studentId] = resource
+                    reserved.append(studentId)
+        try:
+            yield
+        except BaseException:
+            with self._lock:
+                for studentId in reserved:
+                    if self._owners.get(studentId) == resource:
+                        del self._owners[studentId]
+            raise
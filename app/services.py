@@ -1,65 +1,1514 @@
+import asyncio
 import csv
-from typing import List, Type, Any
+import heapq
+import io
+import itertools
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from operator import attrgetter, itemgetter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type, Any
+from urllib.parse import quote, unquote
+from app.indexes import HashIndex, SortedIndex, is_missing
+from app.metrics import metrics
+from app.snapshot import column_kind, read_snapshot, source_stamp, write_snapshot
 from app.model.student import Student
 from app.model.undergraduate_student import UndergraduateStudent
 from app.model.scientific_initiation_student import ScientificInitiationStudent
 from app.model.post_graduate_student import PostGraduateStudent
 
-class CSVService:
-    def __init__(self, filename: str, schema: Type[Any], fieldnames: List[str]):
+try:
+    import fcntl
+except ImportError:  # Windows: sem locks consultivos entre processos
+    fcntl = None
+
+class DuplicateStudentError(ValueError):
+    """Levantada quando um studentId já existe no armazenamento."""
+
+    def __init__(self, studentId: str, resource: Optional[str] = None):
+        super().__init__(f'studentId duplicado: {studentId}')
+        self.studentId = studentId
+        # Recurso que já possui o studentId, quando o conflito é entre tipos.
+        self.resource = resource
+
+class StudentNotFoundError(LookupError):
+    """Levantada por operações em lote quando algum studentId não existe."""
+
+    def __init__(self, studentIds: List[str]):
+        super().__init__(f'studentIds não encontrados: {", ".join(studentIds)}')
+        self.studentIds = studentIds
+
+class ChangesExpiredError(LookupError):
+    """Levantada quando o histórico pedido ao feed de alterações já foi descartado."""
+
+    def __init__(self, since: int, oldest: int):
+        super().__init__(f'Alterações anteriores a {oldest} não estão mais disponíveis')
+        self.since = since
+        # Menor ``since`` ainda atendido.
+        self.oldest = oldest
+
+# Último seq gravado no log, compartilhado entre processos via mmap.
+_SEQ = struct.Struct('<q')
+
+def _completed() -> Future:
+    """``Future`` já resolvido, para mutações que não geram gravação."""
+    future: Future = Future()
+    future.set_result(None)
+    return future
+
+class RWLock:
+    """Lock de leitores/escritor com preferência para o escritor (não reentrante)."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+@dataclass
+class StudentFilter:
+    """Critérios de busca combinados com E.
+
+    ``equals`` compara por igualdade, ``ranges`` aceita faixas fechadas
+    ``(mínimo, máximo)`` em que ``None`` deixa o limite aberto e ``prefixes``
+    filtra campos de texto pelo prefixo. Critérios vazios são descartados e
+    campos vazios não atendem a faixas nem a prefixos.
+    """
+
+    equals: Dict[str, Any] = field(default_factory=dict)
+    ranges: Dict[str, Tuple[Optional[Any], Optional[Any]]] = field(default_factory=dict)
+    prefixes: Dict[str, str] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.equals = {name: value for name, value in self.equals.items() if value is not None}
+        self.ranges = {name: bounds for name, bounds in self.ranges.items() if bounds != (None, None)}
+        self.prefixes = {name: prefix for name, prefix in self.prefixes.items() if prefix}
+
+    def __bool__(self) -> bool:
+        return bool(self.equals or self.ranges or self.prefixes)
+
+    def matches(self, item: Any) -> bool:
+        for name, value in self.equals.items():
+            if getattr(item, name) != value:
+                return False
+        for name, (low, high) in self.ranges.items():
+            value = getattr(item, name)
+            if is_missing(value) or (low is not None and value < low) or (high is not None and value > high):
+                return False
+        for name, prefix in self.prefixes.items():
+            value = getattr(item, name)
+            if is_missing(value) or not value.startswith(prefix):
+                return False
+        return True
+
+class StorageService(ABC):
+    """Interface comum dos armazenamentos de estudantes.
+
+    Cada instância guarda um único tipo de estudante (``schema``), identificado
+    por ``studentId``.
+    """
+
+    schema: Type[Any]
+    fieldnames: List[str]
+
+    def __init__(self):
+        self._listeners: List[Callable[[List[str], List[str]], None]] = []
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'{type(self).__name__}-write')
+
+    def subscribe(self, listener: Callable[[List[str], Optional[List[str]]], None]):
+        """Registra ``listener(adicionados, removidos)``, chamado a cada escrita
+        com os studentIds que passaram a existir e os que deixaram de existir.
+
+        Escritas de outros processos são avisadas quando o serviço as alcança
+        (ver ``sync``). ``removidos`` é ``None`` quando o conjunto foi
+        substituído por inteiro: ``adicionados`` traz então todos os atuais.
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, added: List[str], removed: Optional[List[str]]):
+        if added or removed is None or removed:
+            for listener in self._listeners:
+                listener(added, removed)
+
+    def sync(self):
+        """Alcança as escritas gravadas por outros processos e avisa os listeners."""
+
+    async def sync_async(self):
+        await self._read(self.sync)
+
+    @property
+    @abstractmethod
+    def version(self) -> int:
+        """Contador incrementado a cada escrita; serve para invalidar caches."""
+
+    @property
+    def revision(self) -> str:
+        """Identifica o estado atual dos dados (usado como ETag)."""
+        return str(self.version)
+
+    @property
+    @abstractmethod
+    def modified(self) -> float:
+        """Instante (epoch) da última escrita."""
+
+    @property
+    @abstractmethod
+    def seq(self) -> int:
+        """Número de sequência da última alteração gravada (ver ``changes``)."""
+
+    @abstractmethod
+    def changes(self, since: int, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """Alterações com seq maior que ``since``, em ordem, e o seq mais recente.
+
+        Cada alteração é um registro ``{'seq', 'op', ...}`` com as mesmas
+        operações do log (``add``, ``add_many``, ``upsert_many``, ``update``,
+        ``update_many``, ``delete``, ``delete_many`` e ``reset``; depois de um ``reset`` o consumidor deve
+        reexportar o recurso). Levanta ``ChangesExpiredError`` se parte do
+        intervalo pedido já foi descartada.
+        """
+
+    @abstractmethod
+    def read_all(self) -> List[Any]:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def page(self, cursor: Optional[str] = None, limit: Optional[int] = None,
+             filters: Optional[StudentFilter] = None) -> Tuple[List[Any], Optional[str]]:
+        """Retorna até ``limit`` itens depois de ``cursor`` e o cursor da próxima página.
+
+        O cursor marca a posição de inserção do último item entregue (não um
+        deslocamento): cada página é uma busca por posição, e escritas entre
+        uma página e outra não fazem itens se repetirem ou serem pulados.
+        Cursores malformados levantam ``ValueError``.
+        """
+
+    @abstractmethod
+    def iter_items(self, cursor: Optional[str] = None, limit: Optional[int] = None,
+                   filters: Optional[StudentFilter] = None) -> Iterator[Any]:
+        """Como ``page``, mas percorre os itens sob demanda; o cursor é validado
+        na chamada, antes da iteração."""
+
+    @abstractmethod
+    def get(self, studentId: str) -> Any:
+        ...
+
+    @abstractmethod
+    def add(self, item: Any):
+        """Insere o item; levanta ``DuplicateStudentError`` se o studentId já existe."""
+
+    @abstractmethod
+    def bulk_add(self, items: List[Any]):
+        """Insere todos os itens ou nenhum; levanta ``DuplicateStudentError``."""
+
+    @abstractmethod
+    def bulk_upsert(self, items: List[Any]) -> Tuple[int, int]:
+        """Insere os itens novos e substitui os existentes numa única escrita.
+
+        Retorna ``(criados, atualizados)``.
+        """
+
+    @abstractmethod
+    def bulk_upsert_chunks(self, chunks: Iterable[List[Any]]) -> Tuple[int, int]:
+        """Como ``bulk_upsert``, mas consome os itens bloco a bloco numa única
+        transação: só o bloco atual precisa estar montado. Se o iterador
+        levantar uma exceção, nada é gravado. Retorna ``(criados, atualizados)``.
+        """
+
+    @abstractmethod
+    def update(self, studentId: str, new_item: Any):
+        """Substitui o item; levanta ``DuplicateStudentError`` se o novo
+        studentId já pertence a outro item."""
+
+    @abstractmethod
+    def bulk_patch(self, patches: Dict[str, Dict[str, Any]]) -> List[str]:
+        """Altera só os campos dados de cada studentId, numa única escrita.
+
+        ``patches`` mapeia studentId -> {campo: valor já validado}; o studentId
+        não pode ser alterado. Todos ou nenhum: levanta
+        ``StudentNotFoundError`` se algum não existe. Retorna os studentIds
+        alterados.
+        """
+
+    @abstractmethod
+    def bulk_patch_where(self, filters: StudentFilter, fields: Dict[str, Any]) -> List[str]:
+        """Aplica ``fields`` a todos os itens que atendem ``filters``, numa única escrita."""
+
+    @abstractmethod
+    def delete(self, studentId: str):
+        ...
+
+    @abstractmethod
+    def bulk_delete(self, studentIds: List[str]) -> List[str]:
+        """Remove todos os studentIds numa única escrita, ou nenhum
+        (``StudentNotFoundError``). Retorna os studentIds removidos."""
+
+    @abstractmethod
+    def bulk_delete_where(self, filters: StudentFilter) -> List[str]:
+        """Remove todos os itens que atendem ``filters``, numa única escrita."""
+
+    @abstractmethod
+    def write_all(self, items: List[Any]):
+        ...
+
+    def _check_patch(self, fields: Dict[str, Any]):
+        unknown = [name for name in fields if name not in self.fieldnames or name == 'studentId']
+        if unknown:
+            raise ValueError(f'Campos que não podem ser alterados em lote: {", ".join(unknown)}')
+
+    def iter_rows(self) -> Iterator[Tuple[Any, ...]]:
+        """Percorre os registros como tuplas na ordem de ``fieldnames``."""
+        for item in self.iter_items():
+            data = item.dict()
+            yield tuple(data[name] for name in self.fieldnames)
+
+    # Variantes assíncronas, usadas pelos handlers da API. Por padrão executam
+    # a versão síncrona fora do event loop: leituras no executor padrão do
+    # loop e escritas num executor próprio de uma única thread, que as
+    # serializa. Backends em memória sobrescrevem para responder direto.
+
+    async def _read(self, method: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+
+    async def _write(self, method: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._write_executor, method, *args)
+
+    async def get_async(self, studentId: str) -> Any:
+        return await self._read(self.get, studentId)
+
+    async def page_async(self, cursor: Optional[str] = None, limit: Optional[int] = None,
+                         filters: Optional[StudentFilter] = None) -> Tuple[List[Any], Optional[str]]:
+        return await self._read(self.page, cursor, limit, filters)
+
+    async def revision_async(self) -> Tuple[str, float]:
+        """``(revision, modified)``, lidos juntos fora do event loop."""
+        return await self._read(lambda: (self.revision, self.modified))
+
+    async def add_async(self, item: Any):
+        await self._write(self.add, item)
+
+    async def bulk_add_async(self, items: List[Any]):
+        await self._write(self.bulk_add, items)
+
+    async def bulk_upsert_async(self, items: List[Any]) -> Tuple[int, int]:
+        return await self._write(self.bulk_upsert, items)
+
+    async def bulk_upsert_chunks_async(self, chunks: Iterable[List[Any]]) -> Tuple[int, int]:
+        return await self._write(self.bulk_upsert_chunks, chunks)
+
+    async def update_async(self, studentId: str, new_item: Any):
+        await self._write(self.update, studentId, new_item)
+
+    async def bulk_patch_async(self, patches: Dict[str, Dict[str, Any]]) -> List[str]:
+        return await self._write(self.bulk_patch, patches)
+
+    async def bulk_patch_where_async(self, filters: StudentFilter, fields: Dict[str, Any]) -> List[str]:
+        return await self._write(self.bulk_patch_where, filters, fields)
+
+    async def delete_async(self, studentId: str):
+        await self._write(self.delete, studentId)
+
+    async def bulk_delete_async(self, studentIds: List[str]) -> List[str]:
+        return await self._write(self.bulk_delete, studentIds)
+
+    async def bulk_delete_where_async(self, filters: StudentFilter) -> List[str]:
+        return await self._write(self.bulk_delete_where, filters)
+
+    def close(self):
+        self._write_executor.shutdown()
+
+class CSVService(StorageService):
+    """Armazena os registros em memória, indexados por studentId.
+
+    O arquivo CSV é lido uma única vez na inicialização; a partir daí as
+    leituras são atendidas pelo dicionário em memória e as escritas são
+    persistidas no disco sem reler o arquivo.
+
+    Com ``journal=True`` cada escrita é apenas anexada a um log
+    (``<arquivo>.log``) e o CSV passa a ser um snapshot, regravado em segundo
+    plano quando o log ultrapassa ``compact_threshold`` bytes.
+
+    Os registros ficam em memória como tuplas compactas (``namedtuple`` com os
+    campos de ``fieldnames``), decodificadas sem validação: os dados foram
+    gravados pelo próprio serviço e a validação acontece apenas na entrada da
+    API. Os modelos ``schema`` só são montados (``model_construct``) para os
+    registros efetivamente devolvidos por ``get``, ``page``, ``iter_items`` e
+    ``read_all``; ``add``, ``update`` etc. recebem modelos já validados.
+
+    Com ``snapshot=True`` o serviço mantém ao lado do CSV uma cópia binária
+    colunar (``<arquivo>.snap``, ver ``app.snapshot``), lida via ``mmap`` na
+    inicialização em vez de interpretar o texto. Ela é regravada junto com o
+    CSV e ignorada (e refeita) quando o CSV muda por fora; o CSV continua
+    sendo o formato de troca.
+
+    Os campos de ``HASH_INDEXED`` e ``SORTED_INDEXED`` presentes em
+    ``fieldnames`` ganham índices secundários, mantidos a cada escrita e usados
+    pelas buscas com ``StudentFilter``.
+
+    Cada carga e gravação é medida em ``app.metrics`` (tempo por fase e
+    bytes lidos/gravados), rotulada com ``name`` (nome do arquivo sem extensão).
+
+    Concorrência: o estado em memória é protegido por um ``RWLock``. As
+    mutações são aplicadas em memória e enfileiradas para uma única thread
+    escritora, que grava tudo o que estiver na fila de uma vez (group commit)
+    sob um lock ``fcntl`` exclusivo em ``<arquivo>.lock``; quem escreveu só
+    retorna depois que a gravação termina. O snapshot CSV é sempre trocado
+    atomicamente (arquivo temporário + rename).
+
+    As variantes assíncronas não usam executor: leituras são respondidas da
+    memória e as escritas aguardam (``asyncio.wrap_future``) o mesmo
+    ``Future`` da fila da thread escritora. A exceção é alcançar as escritas
+    de outros processos (abaixo), que bloqueia e roda no executor padrão.
+
+    Vários processos (workers) podem abrir o mesmo arquivo com
+    ``journal=True``. Cada registro do log recebe um número de sequência
+    (``seq``) e o último gravado fica num contador compartilhado via ``mmap``
+    (``<arquivo>.seq``). Antes de cada leitura ou escrita o serviço compara o
+    contador com o último seq que aplicou e, se estiver atrás, lê só o final
+    do log (seguindo rotações) e aplica as alterações dos outros processos,
+    reaplicando por cima as suas ainda não gravadas. O mesmo log alimenta
+    ``changes``. A unicidade do studentId entre processos vale para o estado
+    que cada um já viu; duas inserções simultâneas do mesmo ID em workers
+    diferentes terminam com a última gravada.
+    """
+
+    HASH_INDEXED = ('major', 'supervisor')
+    SORTED_INDEXED = ('name', 'age', 'scholarshipAmount')
+
+    def __init__(self, filename: str, schema: Type[Any], fieldnames: List[str],
+                 journal: bool = False, compact_threshold: int = 1024 * 1024, snapshot: bool = False):
+        super().__init__()
         self.filename = filename
+        self.name = os.path.splitext(os.path.basename(filename))[0]
         self.schema = schema
         self.fieldnames = fieldnames
+        self.journal = journal
+        self.compact_threshold = compact_threshold
+        self.journal_filename = filename + '.log'
+        self.lock_filename = filename + '.lock'
+        self.seq_filename = filename + '.seq'
+        self.snapshot = snapshot
+        self.snapshot_filename = filename + '.snap'
+        self._row_type = namedtuple(f'{schema.__name__}Row', fieldnames)
+        self._decoders = [self._decoder(name) for name in fieldnames]
+        self._kinds = [column_kind(schema.model_fields[name].annotation if name in schema.model_fields else str)
+                       for name in fieldnames]
+        self._items: Dict[str, Any] = {}
+        # Posição de inserção de cada studentId: ordena os resultados das buscas
+        # e serve de cursor da paginação (``_order`` é o índice por posição).
+        self._positions: Dict[str, int] = {}
+        self._order = SortedIndex('position')
+        self._next_position = 0
+        self._hash_indexes = {name: HashIndex(name) for name in self.HASH_INDEXED if name in fieldnames}
+        self._sorted_indexes = {name: SortedIndex(name) for name in self.SORTED_INDEXED if name in fieldnames}
+        self._version = 0
+        # O contador é local ao processo: a época distingue as revisões de
+        # estados que só existem nesta instância (ver ``revision``).
+        self._epoch = os.urandom(4).hex()
+        self._modified = 0.0
+        self._lock = RWLock()
+        self._queue: queue.Queue = queue.Queue()
+        # Registros já aplicados em memória e ainda não gravados, em ordem.
+        self._pending: deque = deque()
+        self._journal = None
+        self._compaction: Optional[threading.Thread] = None
+        self._seq = 0
+        self._counter = None
+        self._tail = None
+        self._tail_offset = 0
+        self._sync_lock = threading.Lock()
+        old_journal = self.journal_filename + '.old'
+        with self._file_lock():
+            try:
+                with open(self.filename, 'x', newline='') as f:
+                    writer = csv.DictWriter(f, fieldnames=self.fieldnames)
+                    writer.writeheader()
+            except FileExistsError:
+                pass
+            if self.journal:
+                self._open_counter()
+            header = self._load(repair=True)
+            # Cabeçalho diferente do esperado ou compactação interrompida:
+            # regrava o snapshot para que as próximas linhas possam ser
+            # anexadas com segurança.
+            if header != self.fieldnames or os.path.exists(old_journal):
+                self._write_snapshot(list(self._items.values()))
+                if os.path.exists(old_journal):
+                    os.remove(old_journal)
+            if self.journal:
+                self._journal = open(self.journal_filename, 'ab')
+                self._open_tail()
+            # Última escrita conhecida: a mais recente entre o CSV e o log.
+            self._modified = max(os.path.getmtime(path) for path in (self.filename, self.journal_filename)
+                                 if os.path.exists(path))
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True,
+                                        name=f'csv-writer:{os.path.basename(filename)}')
+        self._writer.start()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool = True):
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_filename, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _decoder(self, name: str) -> Callable[[str], Any]:
+        # Conversão de tipos conforme a anotação do campo no schema.
+        field = self.schema.model_fields.get(name)
+        convert = field.annotation if field and field.annotation in (int, float) else None
+        if convert is None:
+            return str
+        return lambda value: convert(value) if value != '' else value
+
+    def _columns(self, header: List[str]) -> List[int]:
+        missing = [name for name in self.fieldnames if name not in header]
+        if missing:
+            raise ValueError(f'{self.filename}: colunas ausentes no cabeçalho: {", ".join(missing)}')
+        return [header.index(name) for name in self.fieldnames]
+
+    def _to_row(self, item: Any) -> Any:
+        return self._row_type._make([getattr(item, name) for name in self.fieldnames])
+
+    def _from_dict(self, data: Dict[str, Any]) -> Any:
+        return self._row_type._make([data[name] for name in self.fieldnames])
+
+    def _model(self, row: Any) -> Any:
+        # Sem validação: a linha veio do próprio armazenamento.
+        return self.schema.model_construct(**row._asdict())
+
+    def _load(self, repair: bool = False) -> Optional[List[str]]:
+        """Reconstrói o estado em memória a partir do snapshot e do log."""
+        self._clear()
+        if self.snapshot and self._load_binary():
+            header = self.fieldnames
+        else:
+            header = self._load_csv()
+            # Só quem pode alterar os arquivos (a inicialização) refaz a cópia binária.
+            if self.snapshot and repair and header == self.fieldnames:
+                self._save_binary(list(self._items.values()))
+        if self.journal:
+            # Um log ".old" existe durante uma compactação (deste ou de outro
+            # processo) ou se ela foi interrompida.
+            seq = max(self._replay(self.journal_filename + '.old', repair),
+                      self._replay(self.journal_filename, repair))
+            self._seq = max(seq, self._shared_seq())
+        return header
+
+    def _load_binary(self) -> bool:
+        with metrics.timer('storage_phase_seconds', resource=self.name, op='binary_snapshot', phase='read'):
+            columns = read_snapshot(self.snapshot_filename, self.fieldnames, source_stamp(self.filename))
+        if columns is None:
+            return False
+        metrics.inc('storage_bytes_total', os.path.getsize(self.snapshot_filename),
+                    resource=self.name, op='binary_snapshot', direction='read')
+        self._put_all(map(self._row_type._make, zip(*columns)))
+        return True
+
+    def _save_binary(self, rows: List[Any]):
+        with metrics.timer('storage_phase_seconds', resource=self.name, op='binary_snapshot', phase='write'):
+            saved = write_snapshot(self.snapshot_filename, self.fieldnames, self._kinds, rows,
+                                   source_stamp(self.filename))
+        if saved:
+            metrics.inc('storage_bytes_total', os.path.getsize(self.snapshot_filename),
+                        resource=self.name, op='binary_snapshot', direction='write')
+
+    def _load_csv(self) -> Optional[List[str]]:
+        with metrics.timer('storage_phase_seconds', resource=self.name, op='load', phase='read'):
+            with open(self.filename, 'rb') as f:
+                data = f.read()
+        metrics.inc('storage_bytes_total', len(data), resource=self.name, op='load', direction='read')
+        with metrics.timer('storage_phase_seconds', resource=self.name, op='load', phase='parse'):
+            reader = csv.reader(io.StringIO(data.decode('utf-8'), newline=''))
+            header = next(reader, None)
+            columns = None
+            make, decoders = self._row_type._make, self._decoders
+            rows = []
+            for values in reader:
+                if not values:
+                    continue
+                if columns is None:
+                    columns = self._columns(header)
+                rows.append(make([decode(values[i]) for decode, i in zip(decoders, columns)]))
+            self._put_all(rows)
+        return header
+
+    @staticmethod
+    def _parse_journal(data: bytes) -> Tuple[List[Dict[str, Any]], int]:
+        """Registros completos de um trecho do log e quantos bytes eles ocupam."""
+        records = []
+        offset = 0
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                break
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            offset += len(line)
+        return records, offset
+
+    def _replay(self, path: str, repair: bool = False) -> int:
+        """Aplica o log ``path`` e devolve o maior seq encontrado."""
+        if not os.path.exists(path):
+            return 0
+        with metrics.timer('storage_phase_seconds', resource=self.name, op='replay', phase='read'):
+            with open(path, 'rb') as f:
+                data = f.read()
+        metrics.inc('storage_bytes_total', len(data), resource=self.name, op='replay', direction='read')
+        with metrics.timer('storage_phase_seconds', resource=self.name, op='replay', phase='parse'):
+            records, offset = self._parse_journal(data)
+        with metrics.timer('storage_phase_seconds', resource=self.name, op='replay', phase='model'):
+            for record in records:
+                self._apply(record)
+        # Registro incompleto (escrita interrompida): descarta a cauda.
+        if offset != len(data) and repair:
+            os.truncate(path, offset)
+        return max((record.get('seq', 0) for record in records), default=0)
+
+    def _open_counter(self):
+        f = open(self.seq_filename, 'a+b')
+        if os.fstat(f.fileno()).st_size < _SEQ.size:
+            f.truncate(_SEQ.size)
+        self._counter_file = f
+        self._counter = mmap.mmap(f.fileno(), _SEQ.size)
+
+    def _shared_seq(self) -> int:
+        return _SEQ.unpack_from(self._counter)[0]
+
+    def _open_tail(self):
+        """Passa a acompanhar o log atual a partir do fim (chamar com o lock de arquivo)."""
+        if self._tail is not None:
+            self._tail.close()
+        self._tail = open(self.journal_filename, 'rb')
+        self._tail_offset = os.fstat(self._tail.fileno()).st_size
+
+    def _drain_tail(self) -> List[Dict[str, Any]]:
+        self._tail.seek(self._tail_offset)
+        records, offset = self._parse_journal(self._tail.read())
+        self._tail_offset += offset
+        return records
+
+    def _read_tail(self) -> List[Dict[str, Any]]:
+        """Registros anexados ao log desde a última leitura (chamar com o lock de arquivo).
+
+        Se o log foi rotacionado, termina o arquivo antigo e segue pelos
+        seguintes (o ``.old`` atual, se for outro, e o log novo); um log
+        rotacionado e já descartado aparece como lacuna nos seqs.
+        """
+        records = self._drain_tail()
+        current = os.stat(self.journal_filename).st_ino
+        if current == os.fstat(self._tail.fileno()).st_ino:
+            return records
         try:
-            with open(self.filename, 'x', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=self.fieldnames)
-                writer.writeheader()
-        except FileExistsError:
+            old = os.stat(self.journal_filename + '.old').st_ino
+        except FileNotFoundError:
+            old = None
+        paths = [self.journal_filename]
+        if old is not None and old != os.fstat(self._tail.fileno()).st_ino:
+            paths.insert(0, self.journal_filename + '.old')
+        for path in paths:
+            self._tail.close()
+            self._tail = open(path, 'rb')
+            self._tail_offset = 0
+            records += self._drain_tail()
+        return records
+
+    def _catch_up(self):
+        """Aplica as alterações gravadas por outros processos (chamar com o lock
+        de arquivo e ``_sync_lock``)."""
+        records = [record for record in self._read_tail() if record.get('seq', 0) > self._seq]
+        last = self._shared_seq()
+        if not records and last <= self._seq:
+            return
+        # Os seqs são consecutivos: uma lacuna indica um log já compactado.
+        complete = (bool(records) and records[-1]['seq'] >= last
+                    and all(record['seq'] == self._seq + i and record['op'] != 'reset'
+                            for i, record in enumerate(records, 1)))
+        with self._lock.write():
+            self._seq = max(last, records[-1]['seq'] if records else 0)
+            # Registros locais já gravados (com seq) vêm antes destes no log e
+            # a thread escritora ainda não os tirou da fila.
+            unwritten = [record for record in self._pending if 'seq' not in record]
+            # Um reset local ainda não gravado vem depois no log e sobrepõe tudo.
+            if any(record['op'] == 'reset' for record in unwritten):
+                return
+            before = set(self._items)
+            if not complete:
+                self._load()
+                self._open_tail()
+            else:
+                for record in records:
+                    self._apply(record)
+            # As escritas locais pendentes serão gravadas depois destas.
+            for record in unwritten:
+                self._apply(record)
+            self._version += 1
+            self._modified = time.time()
+            self._notify([key for key in self._items if key not in before],
+                         [key for key in before if key not in self._items])
+
+    def _behind(self) -> bool:
+        # Uma leitura de 8 bytes: outro processo gravou algo ainda não aplicado?
+        return self._counter is not None and self._shared_seq() > self._seq
+
+    def _sync(self):
+        """Alcança as escritas de outros processos, se o contador compartilhado
+        indicar alguma; quando não há, custa uma leitura de 8 bytes."""
+        if not self._behind():
+            return
+        with self._file_lock(exclusive=False), self._sync_lock:
+            self._catch_up()
+
+    def _clear(self):
+        self._items = {}
+        self._positions = {}
+        self._order.clear()
+        for index in itertools.chain(self._hash_indexes.values(), self._sorted_indexes.values()):
+            index.clear()
+
+    def _index(self, item: Any):
+        for index in itertools.chain(self._hash_indexes.values(), self._sorted_indexes.values()):
+            index.add(item.studentId, getattr(item, index.field))
+
+    def _unindex(self, item: Any):
+        for index in itertools.chain(self._hash_indexes.values(), self._sorted_indexes.values()):
+            index.remove(item.studentId, getattr(item, index.field))
+
+    def _put(self, item: Any):
+        old = self._items.get(item.studentId)
+        if old is not None:
+            self._unindex(old)
+        else:
+            self._positions[item.studentId] = self._next_position
+            self._order.add(item.studentId, self._next_position)
+            self._next_position += 1
+        self._items[item.studentId] = item
+        self._index(item)
+
+    def _put_all(self, rows: Iterable[Any]):
+        # Carga inicial (estado vazio): os índices são montados de uma vez no fim.
+        for row in rows:
+            if row.studentId not in self._positions:
+                self._positions[row.studentId] = self._next_position
+                self._next_position += 1
+            self._items[row.studentId] = row
+        rows = list(self._items.values())
+        self._order.rebuild(self._positions, self._positions.values())
+        for index in itertools.chain(self._hash_indexes.values(), self._sorted_indexes.values()):
+            index.rebuild(self._items, map(attrgetter(index.field), rows))
+
+    def _remove(self, studentId: str) -> Any:
+        item = self._items.pop(studentId, None)
+        if item is not None:
+            self._unindex(item)
+            self._order.remove(studentId, self._positions.pop(studentId))
+        return item
+
+    def _replace(self, studentId: str, new_item: Any):
+        if new_item.studentId != studentId:
+            # O studentId mudou: reconstrói o dicionário mantendo a ordem.
+            self._remove(new_item.studentId)
+            old = self._items[studentId]
+            self._items = {
+                (new_item.studentId if key == studentId else key): (new_item if key == studentId else item)
+                for key, item in self._items.items()
+            }
+            self._unindex(old)
+            position = self._positions.pop(studentId)
+            self._positions[new_item.studentId] = position
+            self._order.remove(studentId, position)
+            self._order.add(new_item.studentId, position)
+            self._index(new_item)
+        else:
+            self._put(new_item)
+
+    def _apply(self, record: Dict[str, Any]):
+        op = record['op']
+        if op == 'add':
+            self._put(self._from_dict(record['item']))
+        elif op in ('add_many', 'upsert_many'):
+            for data in record['items']:
+                self._put(self._from_dict(data))
+        elif op == 'update':
+            if record['studentId'] in self._items:
+                self._replace(record['studentId'], self._from_dict(record['item']))
+        elif op == 'update_many':
+            for data in record['items']:
+                if data['studentId'] in self._items:
+                    self._put(self._from_dict(data))
+        elif op == 'delete':
+            self._remove(record['studentId'])
+        elif op == 'delete_many':
+            for studentId in record['studentIds']:
+                self._remove(studentId)
+
+    def _write_snapshot(self, items: List[Any]):
+        tmp = f'{self.filename}.{os.getpid()}.tmp'
+        with metrics.timer('storage_phase_seconds', resource=self.name, op='snapshot', phase='write'):
+            with open(tmp, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(self.fieldnames)
+                writer.writerows(items)
+                f.flush()
+                os.fsync(f.fileno())
+            size = os.path.getsize(tmp)
+            os.replace(tmp, self.filename)
+        metrics.inc('storage_bytes_total', size, resource=self.name, op='snapshot', direction='write')
+        if self.snapshot:
+            self._save_binary(items)
+
+    def _snapshot_items(self) -> List[Any]:
+        with self._lock.read():
+            return list(self._items.values())
+
+    def _submit(self, record: Optional[Dict[str, Any]]) -> Future:
+        return self._submit_all(None if record is None else [record])
+
+    def _submit_all(self, records: Optional[List[Dict[str, Any]]]) -> Future:
+        # Chamado com o lock de escrita: a ordem da fila é a ordem em memória.
+        # Os registros de uma mesma chamada vão para o disco na mesma gravação.
+        mutations = [record for record in records or () if record['op'] != 'compact']
+        if mutations:
+            self._version += 1
+            self._modified = time.time()
+            self._pending.extend(mutations)
+        future: Future = Future()
+        # Já "em execução": cancelar quem espera não cancela a gravação.
+        future.set_running_or_notify_cancel()
+        self._queue.put((records, future))
+        return future
+
+    def _writer_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = [future for records, future in batch if records is None]
+            batch = [(records, future) for records, future in batch if records is not None]
+            if batch:
+                records = [record for entry, _ in batch for record in entry]
+                written = sum(1 for record in records if record['op'] != 'compact')
+                try:
+                    self._commit(records)
+                except Exception as e:
+                    # O disco não reflete as mutações: volta ao estado gravado
+                    # e reaplica só o que ainda está na fila.
+                    with self._file_lock(exclusive=False), self._sync_lock:
+                        with self._lock.write():
+                            for _ in range(written):
+                                self._pending.popleft()
+                        self._reload()
+                    for _, future in batch:
+                        future.set_exception(e)
+                else:
+                    with self._lock.write():
+                        for _ in range(written):
+                            self._pending.popleft()
+                    for _, future in batch:
+                        future.set_result(None)
+            if stop:
+                for future in stop:
+                    future.set_result(None)
+                return
+
+    def _reload(self):
+        """Volta ao estado gravado e reaplica as escritas ainda não gravadas
+        (chamar com o lock de arquivo e ``_sync_lock``)."""
+        with self._lock.write():
+            before = set(self._items)
+            self._load()
+            if self.journal:
+                self._open_tail()
+            for record in self._pending:
+                if 'seq' not in record:
+                    self._apply(record)
+            self._version += 1
+            self._modified = time.time()
+            self._notify([key for key in self._items if key not in before],
+                         [key for key in before if key not in self._items])
+
+    def _reset_files(self, record: Optional[Dict[str, Any]]):
+        """Regrava o snapshot com o estado em memória e recomeça o log pelo
+        registro de ``reset`` (chamar com o lock de arquivo)."""
+        self._write_snapshot(self._snapshot_items())
+        if not self.journal:
+            return
+        # O snapshot já inclui o log antigo: uma compactação pendente (deste ou
+        # de outro processo) encontra o ".old" ausente e não o sobrescreve.
+        old = self.journal_filename + '.old'
+        if os.path.exists(old):
+            os.remove(old)
+        # O log recomeça pelo registro de reset, num arquivo novo: quem
+        # acompanha o log recarrega o snapshot ao encontrá-lo.
+        self._restart_journal(record)
+
+    def _commit(self, records: List[Dict[str, Any]]):
+        ops = [record['op'] for record in records]
+        compact = 'compact' in ops
+        if (compact or 'reset' in ops) and self._compaction is not None:
+            self._compaction.join()
+        records = [record for record in records if record['op'] != 'compact']
+        with self._file_lock():
+            if self.journal:
+                # Primeiro aplica o que outros processos gravaram: a numeração
+                # continua a partir do último seq do log.
+                with self._sync_lock:
+                    self._catch_up()
+                    seq = self._seq
+                for record in records:
+                    seq += 1
+                    record['seq'] = seq
+            if 'reset' in ops:
+                # O estado em memória já inclui tudo o que está na fila.
+                last = max(i for i, record in enumerate(records) if record['op'] == 'reset')
+                self._reset_files(records[last])
+                if not self.journal:
+                    return
+                records = records[last + 1:]
+            if self.journal:
+                size = self._append_journal(records) if records else self._journal.tell()
+                self._advance(seq)
+                if compact or size >= self.compact_threshold:
+                    self._rotate_journal(background=not compact)
+            elif all(record['op'] in ('add', 'add_many') for record in records):
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=self.fieldnames)
+                for record in records:
+                    writer.writerows(record['items'] if record['op'] == 'add_many' else [record['item']])
+                data = buffer.getvalue().encode('utf-8')
+                with metrics.timer('storage_phase_seconds', resource=self.name, op='append', phase='write'):
+                    with open(self.filename, 'ab') as f:
+                        f.write(data)
+                metrics.inc('storage_bytes_total', len(data), resource=self.name, op='append', direction='write')
+            else:
+                self._write_snapshot(self._snapshot_items())
+
+    def _advance(self, seq: int):
+        # As próprias gravações já estão em memória: a leitura do log pula
+        # para o fim e o contador compartilhado avisa os outros processos.
+        with self._sync_lock:
+            self._seq = seq
+            if os.fstat(self._tail.fileno()).st_ino != os.fstat(self._journal.fileno()).st_ino:
+                self._tail.close()
+                self._tail = open(self.journal_filename, 'rb')
+            self._tail_offset = os.fstat(self._journal.fileno()).st_size
+            _SEQ.pack_into(self._counter, 0, seq)
+
+    def _restart_journal(self, record: Dict[str, Any]):
+        tmp = f'{self.journal_filename}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write((json.dumps(record) + '\n').encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.journal_filename)
+        self._journal.close()
+        self._journal = open(self.journal_filename, 'ab')
+
+    def _reopen_journal(self):
+        # Outro processo pode ter rotacionado o log durante uma compactação.
+        try:
+            current = os.stat(self.journal_filename).st_ino
+        except FileNotFoundError:
+            current = None
+        if current != os.fstat(self._journal.fileno()).st_ino:
+            self._journal.close()
+            self._journal = open(self.journal_filename, 'ab')
+
+    def _append_journal(self, records: List[Dict[str, Any]]) -> int:
+        self._reopen_journal()
+        data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode('utf-8')
+        offset = self._journal.seek(0, os.SEEK_END)
+        try:
+            with metrics.timer('storage_phase_seconds', resource=self.name, op='journal', phase='write'):
+                self._journal.write(data)
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+        except Exception:
+            self._journal.truncate(offset)
+            raise
+        metrics.inc('storage_bytes_total', len(data), resource=self.name, op='journal', direction='write')
+        return offset + len(data)
+
+    def _rotate_journal(self, background: bool):
+        if self._compaction is not None:
+            return
+        old = self.journal_filename + '.old'
+        if os.path.exists(old):
+            # Compactação de outro processo em andamento.
+            if background:
+                return
+            # O estado em memória já inclui o log antigo: conclui por ele.
+            self._write_snapshot(self._snapshot_items())
+            os.remove(old)
+        self._journal.close()
+        os.replace(self.journal_filename, old)
+        self._journal = open(self.journal_filename, 'ab')
+        items = self._snapshot_items()
+        if background:
+            self._compaction = threading.Thread(target=self._finish_compaction,
+                                                args=(items, os.stat(old).st_ino), daemon=True)
+            self._compaction.start()
+        else:
+            self._write_snapshot(items)
+            os.remove(old)
+
+    def _finish_compaction(self, items: List[Any], inode: int):
+        old = self.journal_filename + '.old'
+        try:
+            with self._file_lock():
+                # Outro processo pode ter concluído esta compactação (ao iniciar
+                # ou num ``compact``) e começado outra.
+                if os.path.exists(old) and os.stat(old).st_ino == inode:
+                    self._write_snapshot(items)
+                    os.remove(old)
+        finally:
+            self._compaction = None
+
+    def compact(self):
+        """Regrava o snapshot CSV com o estado atual e descarta o log aplicado."""
+        if not self.journal:
+            return
+        with self._lock.write():
+            future = self._submit({'op': 'compact'})
+        future.result()
+
+    def close(self):
+        """Espera as escritas pendentes e encerra a thread escritora (uma
+        segunda chamada não faz nada)."""
+        if not self._writer.is_alive():
+            return
+        self._submit(None).result()
+        self._writer.join()
+        if self._compaction is not None:
+            self._compaction.join()
+        if self._journal is not None:
+            self._journal.close()
+            self._tail.close()
+            self._counter.close()
+            self._counter_file.close()
+            # Depois de fechado, o serviço segue respondendo do estado em memória.
+            self._counter = None
+        super().close()
+
+    @property
+    def version(self) -> int:
+        self._sync()
+        return self._version
+
+    @property
+    def revision(self) -> str:
+        """Com o log, o seq compartilhado: workers com o mesmo estado gravado
+        dão o mesmo ETag. Escritas locais ainda não gravadas tornam o estado
+        exclusivo desta instância, e a revisão passa a incluir a época."""
+        self._sync()
+        with self._lock.read():
+            return self._revision()
+
+    def _revision(self) -> str:
+        seq = self._seq
+        if self.journal and all(record.get('seq', seq + 1) <= seq for record in self._pending):
+            return str(seq)
+        return f'{seq}-{self._epoch}.{self._version}'
+
+    @property
+    def modified(self) -> float:
+        self._sync()
+        return self._modified
+
+    async def revision_async(self) -> Tuple[str, float]:
+        await self.sync_async()
+        with self._lock.read():
+            return self._revision(), self._modified
+
+    @property
+    def seq(self) -> int:
+        self._sync()
+        return self._seq
+
+    def sync(self):
+        self._sync()
+
+    async def sync_async(self):
+        # O atraso é verificado aqui; o alcance (lock de arquivo, leitura do
+        # log e, às vezes, recarga completa) bloqueia e vai para o executor.
+        # Um alcance já em andamento segura o lock de escrita em memória: quem
+        # chega espera por ele também no executor, não no event loop.
+        if self._behind() or self._sync_lock.locked():
+            await self._read(self._settle)
+
+    def _settle(self):
+        with self._sync_lock:
             pass
+        self._sync()
+
+    def changes(self, since: int, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """Lê as alterações do log (``.old`` e atual).
+
+        Depois de uma compactação só o log novo continua disponível: ``since``
+        anterior ao primeiro registro restante levanta ``ChangesExpiredError``.
+        """
+        if not self.journal:
+            raise ChangesExpiredError(since, self._seq)
+        records = []
+        with self._file_lock(exclusive=False):
+            for path in (self.journal_filename + '.old', self.journal_filename):
+                try:
+                    with open(path, 'rb') as f:
+                        records += self._parse_journal(f.read())[0]
+                except FileNotFoundError:
+                    pass
+            last = self._shared_seq()
+        records = [record for record in records if 'seq' in record]
+        oldest = records[0]['seq'] - 1 if records else last
+        if since < oldest:
+            raise ChangesExpiredError(since, oldest)
+        selected = [record for record in records if record['seq'] > since]
+        return selected if limit is None else selected[:limit], last
 
     def read_all(self) -> List[Any]:
-        with open(self.filename, newline='') as f:
-            reader = csv.DictReader(f)
-            items = []
-            for row in reader:
-                # Conversão de tipos conforme necessário
-                if 'age' in row and row['age'] != '':
-                    row['age'] = int(row['age'])
-                if 'workedDays' in row and row['workedDays'] != '':
-                    row['workedDays'] = int(row['workedDays'])
-                if 'scholarshipAmount' in row and row['scholarshipAmount'] != '':
-                    row['scholarshipAmount'] = float(row['scholarshipAmount'])
-                items.append(self.schema(**row))
-            return items
+        self._sync()
+        return [self._model(row) for row in self._snapshot_items()]
+
+    def iter_rows(self) -> Iterator[Tuple[Any, ...]]:
+        # As linhas em memória já são tuplas na ordem de ``fieldnames``.
+        self._sync()
+        yield from self._snapshot_items()
+
+    def count(self) -> int:
+        self._sync()
+        return len(self._items)
+
+    def _search(self, filters: StudentFilter) -> List[Any]:
+        """Itens que atendem ``filters``, em ordem de inserção (chamar com o lock).
+
+        Cada critério com índice reduz o conjunto de candidatos; os critérios
+        sem índice são verificados só nos candidatos restantes.
+        """
+        candidates: Optional[set] = None
+        for name, value in filters.equals.items():
+            if name in self._hash_indexes:
+                ids = self._hash_indexes[name].equal(value)
+                candidates = ids if candidates is None else candidates & ids
+        for name, (low, high) in filters.ranges.items():
+            if name in self._sorted_indexes:
+                ids = self._sorted_indexes[name].between(low, high)
+                candidates = ids if candidates is None else candidates & ids
+        for name, prefix in filters.prefixes.items():
+            if name in self._sorted_indexes:
+                ids = self._sorted_indexes[name].prefix(prefix)
+                candidates = ids if candidates is None else candidates & ids
+        if candidates is None:
+            items = self._items.values()
+        else:
+            items = [self._items[studentId] for studentId in sorted(candidates, key=self._positions.__getitem__)]
+        return [item for item in items if filters.matches(item)]
+
+    @staticmethod
+    def _parse_cursor(cursor: Optional[str]) -> Optional[Tuple[int, str]]:
+        # ``posição:studentId`` do último item entregue. Posições são locais ao
+        # processo; o studentId permite retomar do mesmo item em outro worker
+        # (ou depois de uma recarga), e a posição vale se ele foi removido.
+        if not cursor:
+            return None
+        position, _, studentId = cursor.partition(':')
+        if int(position) < 0:
+            raise ValueError(f'cursor inválido: {cursor}')
+        return int(position), unquote(studentId)
+
+    def _cursor(self, row: Any) -> str:
+        # Cabeçalhos HTTP só aceitam latin-1: o studentId vai codificado.
+        return f'{self._positions[row.studentId]}:{quote(row.studentId, safe="")}'
+
+    def _slice(self, after: Optional[Tuple[int, str]], count: Optional[int],
+               filters: Optional[StudentFilter]) -> List[Any]:
+        """Até ``count`` itens com posição depois de ``after`` (chamar com o lock)."""
+        start = -1 if after is None else self._positions.get(after[1], after[0])
+        rows = (self._items[studentId] for studentId in self._order.following(start))
+        if not filters:
+            return list(itertools.islice(rows, count))
+        candidates = self._selective_candidates(filters, count)
+        if candidates is None:
+            # Percorre a ordem a partir do cursor só até achar ``count`` itens.
+            return list(itertools.islice(filter(filters.matches, rows), count))
+        positions = self._positions
+        matches = [self._items[studentId] for studentId in candidates if positions[studentId] > start]
+        matches = [row for row in matches if filters.matches(row)]
+        key = lambda row: positions[row.studentId]
+        return sorted(matches, key=key) if count is None else heapq.nsmallest(count, matches, key=key)
+
+    def _selective_candidates(self, filters: StudentFilter, count: Optional[int]) -> Optional[set]:
+        """studentIds do critério com índice mais seletivo, se examiná-los custa
+        menos que percorrer a ordem de inserção até achar ``count`` itens
+        (chamar com o lock). Os tamanhos vêm dos índices sem montar conjuntos."""
+        options: List[Tuple[int, Callable[[], set]]] = []
+        for name, value in filters.equals.items():
+            if name in self._hash_indexes:
+                index = self._hash_indexes[name]
+                options.append((index.count_equal(value), partial(index.equal, value)))
+        for name, (low, high) in filters.ranges.items():
+            if name in self._sorted_indexes:
+                index = self._sorted_indexes[name]
+                options.append((index.count_between(low, high), partial(index.between, low, high)))
+        for name, prefix in filters.prefixes.items():
+            if name in self._sorted_indexes:
+                index = self._sorted_indexes[name]
+                options.append((index.count_prefix(prefix), partial(index.prefix, prefix)))
+        if not options:
+            return None
+        size, fetch = min(options, key=itemgetter(0))
+        # Com ``size`` de ``total`` itens atendendo, o percurso visita cerca
+        # de ``count * total / size`` itens até achar ``count``.
+        total = len(self._items)
+        scan = total if count is None or size == 0 else min(total, count * total // size)
+        return fetch() if size < scan else None
+
+    def page(self, cursor: Optional[str] = None, limit: Optional[int] = None,
+             filters: Optional[StudentFilter] = None) -> Tuple[List[Any], Optional[str]]:
+        after = self._parse_cursor(cursor)
+        self._sync()
+        return self._page(after, limit, filters)
+
+    def _page(self, after: Optional[Tuple[int, str]], limit: Optional[int],
+              filters: Optional[StudentFilter]) -> Tuple[List[Any], Optional[str]]:
+        with self._lock.read():
+            # Um item a mais para saber se existe próxima página.
+            rows = self._slice(after, None if limit is None else limit + 1, filters)
+            next_cursor = None
+            if limit is not None and len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = self._cursor(rows[-1])
+        return [self._model(row) for row in rows], next_cursor
+
+    def iter_items(self, cursor: Optional[str] = None, limit: Optional[int] = None,
+                   filters: Optional[StudentFilter] = None) -> Iterator[Any]:
+        return self._iter_items(self._parse_cursor(cursor), limit, filters)
+
+    def _iter_items(self, after: Optional[Tuple[int, str]], limit: Optional[int],
+                    filters: Optional[StudentFilter]) -> Iterator[Any]:
+        """Percorre os itens em ordem de inserção.
+
+        Apenas as referências são copiadas (sob o lock), de modo que escritas
+        concorrentes não interrompem a iteração; o modelo de cada item só é
+        montado quando o consumidor chega nele.
+        """
+        self._sync()
+        with self._lock.read():
+            rows = self._slice(after, limit, filters)
+        for row in rows:
+            yield self._model(row)
 
     def write_all(self, items: List[Any]):
-        with open(self.filename, 'w', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=self.fieldnames)
-            writer.writeheader()
+        self._sync()
+        with self._lock.write():
+            before = set(self._items)
+            self._clear()
             for item in items:
-                writer.writerow(item.dict())
+                self._put(self._to_row(item))
+            future = self._submit({'op': 'reset'})
+            self._notify([key for key in self._items if key not in before],
+                         [key for key in before if key not in self._items])
+        future.result()
+
+    # Cada mutação é aplicada em memória por um método ``_<operação>``, que
+    # devolve o ``Future`` da gravação; as versões síncrona e assíncrona só
+    # diferem em como alcançam os outros processos antes (``_sync`` ou
+    # ``sync_async``, que não bloqueia o event loop) e em como esperam a gravação.
+
+    def _add(self, item: Any) -> Future:
+        row = self._to_row(item)
+        with self._lock.write():
+            # A verificação dos handlers acontece antes de ceder o event loop:
+            # duas inserções concorrentes do mesmo ID só se encontram aqui.
+            if row.studentId in self._items:
+                raise DuplicateStudentError(row.studentId)
+            self._put(row)
+            future = self._submit({'op': 'add', 'item': row._asdict()})
+            self._notify([item.studentId], [])
+        return future
 
     def add(self, item: Any):
-        items = self.read_all()
-        items.append(item)
-        self.write_all(items)
+        self._sync()
+        self._add(item).result()
+
+    async def add_async(self, item: Any):
+        await self.sync_async()
+        await asyncio.wrap_future(self._add(item))
+
+    def _bulk_add(self, items: List[Any]) -> Future:
+        if not items:
+            return _completed()
+        rows = [self._to_row(item) for item in items]
+        with self._lock.write():
+            seen = set()
+            for row in rows:
+                if row.studentId in self._items or row.studentId in seen:
+                    raise DuplicateStudentError(row.studentId)
+                seen.add(row.studentId)
+            for row in rows:
+                self._put(row)
+            # Um único registro no log: uma escrita interrompida é
+            # descartada inteira no replay.
+            future = self._submit({'op': 'add_many', 'items': [row._asdict() for row in rows]})
+            self._notify([row.studentId for row in rows], [])
+        return future
+
+    def bulk_add(self, items: List[Any]):
+        """Insere todos os itens de uma vez ou nenhum deles.
+
+        Os studentIds são verificados contra os registros existentes e entre si
+        antes de qualquer escrita; os itens são persistidos numa única operação
+        de escrita. Levanta ``DuplicateStudentError`` em caso de duplicidade.
+        """
+        self._sync()
+        self._bulk_add(items).result()
+
+    async def bulk_add_async(self, items: List[Any]):
+        await self.sync_async()
+        await asyncio.wrap_future(self._bulk_add(items))
+
+    def _bulk_upsert(self, items: List[Any]) -> Tuple[Future, int]:
+        if not items:
+            return _completed(), 0
+        rows = [self._to_row(item) for item in items]
+        with self._lock.write():
+            created = list(dict.fromkeys(row.studentId for row in rows if row.studentId not in self._items))
+            for row in rows:
+                self._put(row)
+            future = self._submit({'op': 'upsert_many', 'items': [row._asdict() for row in rows]})
+            self._notify(created, [])
+        return future, len(created)
+
+    def bulk_upsert(self, items: List[Any]) -> Tuple[int, int]:
+        self._sync()
+        future, created = self._bulk_upsert(items)
+        future.result()
+        return created, len(items) - created
+
+    async def bulk_upsert_async(self, items: List[Any]) -> Tuple[int, int]:
+        await self.sync_async()
+        future, created = self._bulk_upsert(items)
+        await asyncio.wrap_future(future)
+        return created, len(items) - created
+
+    def bulk_upsert_chunks(self, chunks: Iterable[List[Any]]) -> Tuple[int, int]:
+        """Os blocos viram linhas compactas antes de qualquer lock; depois
+        entram juntos no estado em memória e vão para o disco numa única
+        gravação, como um registro ``upsert_many`` por bloco."""
+        staged = [[self._to_row(item) for item in chunk] for chunk in chunks]
+        staged = [rows for rows in staged if rows]
+        if not staged:
+            return 0, 0
+        self._sync()
+        with self._lock.write():
+            created = list(dict.fromkeys(row.studentId for rows in staged for row in rows
+                                         if row.studentId not in self._items))
+            for rows in staged:
+                for row in rows:
+                    self._put(row)
+            future = self._submit_all([{'op': 'upsert_many', 'items': [row._asdict() for row in rows]}
+                                       for rows in staged])
+            self._notify(created, [])
+        future.result()
+        total = sum(len(rows) for rows in staged)
+        return len(created), total - len(created)
+
+    def _update(self, studentId: str, new_item: Any) -> Future:
+        row = self._to_row(new_item)
+        with self._lock.write():
+            if studentId not in self._items:
+                return _completed()
+            if row.studentId != studentId and row.studentId in self._items:
+                raise DuplicateStudentError(row.studentId)
+            self._replace(studentId, row)
+            future = self._submit({'op': 'update', 'studentId': studentId, 'item': row._asdict()})
+            if row.studentId != studentId:
+                self._notify([row.studentId], [studentId])
+        return future
 
     def update(self, studentId: str, new_item: Any):
-        items = self.read_all()
-        for i, item in enumerate(items):
-            if getattr(item, 'studentId', None) == studentId:
-                items[i] = new_item
-                break
-        self.write_all(items)
+        self._sync()
+        self._update(studentId, new_item).result()
+
+    async def update_async(self, studentId: str, new_item: Any):
+        await self.sync_async()
+        await asyncio.wrap_future(self._update(studentId, new_item))
+
+    def _bulk_patch(self, patches: Optional[Dict[str, Dict[str, Any]]], filters: Optional[StudentFilter] = None,
+                    fields: Optional[Dict[str, Any]] = None) -> Tuple[Future, List[str]]:
+        # Com ``filters``, os alvos são escolhidos sob o mesmo lock da escrita.
+        for patch in ([fields] if patches is None else patches.values()):
+            self._check_patch(patch)
+        with self._lock.write():
+            if patches is None:
+                patches = {row.studentId: fields for row in self._search(filters)}
+            else:
+                missing = [studentId for studentId in patches if studentId not in self._items]
+                if missing:
+                    raise StudentNotFoundError(missing)
+            if not patches:
+                return _completed(), []
+            rows = [self._items[studentId]._replace(**patch) for studentId, patch in patches.items()]
+            for row in rows:
+                self._put(row)
+            future = self._submit({'op': 'update_many', 'items': [row._asdict() for row in rows]})
+        return future, list(patches)
+
+    def bulk_patch(self, patches: Dict[str, Dict[str, Any]]) -> List[str]:
+        self._sync()
+        future, studentIds = self._bulk_patch(patches)
+        future.result()
+        return studentIds
+
+    async def bulk_patch_async(self, patches: Dict[str, Dict[str, Any]]) -> List[str]:
+        await self.sync_async()
+        future, studentIds = self._bulk_patch(patches)
+        await asyncio.wrap_future(future)
+        return studentIds
+
+    def bulk_patch_where(self, filters: StudentFilter, fields: Dict[str, Any]) -> List[str]:
+        self._sync()
+        future, studentIds = self._bulk_patch(None, filters, fields)
+        future.result()
+        return studentIds
+
+    async def bulk_patch_where_async(self, filters: StudentFilter, fields: Dict[str, Any]) -> List[str]:
+        await self.sync_async()
+        future, studentIds = self._bulk_patch(None, filters, fields)
+        await asyncio.wrap_future(future)
+        return studentIds
+
+    def _delete(self, studentId: str) -> Future:
+        with self._lock.write():
+            if self._remove(studentId) is None:
+                return _completed()
+            future = self._submit({'op': 'delete', 'studentId': studentId})
+            self._notify([], [studentId])
+        return future
 
     def delete(self, studentId: str):
-        items = self.read_all()
-        items = [item for item in items if getattr(item, 'studentId', None) != studentId]
-        self.write_all(items)
+        self._sync()
+        self._delete(studentId).result()
+
+    async def delete_async(self, studentId: str):
+        await self.sync_async()
+        await asyncio.wrap_future(self._delete(studentId))
+
+    def _bulk_delete(self, studentIds: Optional[List[str]],
+                     filters: Optional[StudentFilter] = None) -> Tuple[Future, List[str]]:
+        with self._lock.write():
+            if studentIds is None:
+                studentIds = [row.studentId for row in self._search(filters)]
+            else:
+                studentIds = list(dict.fromkeys(studentIds))
+                missing = [studentId for studentId in studentIds if studentId not in self._items]
+                if missing:
+                    raise StudentNotFoundError(missing)
+            if not studentIds:
+                return _completed(), []
+            for studentId in studentIds:
+                self._remove(studentId)
+            future = self._submit({'op': 'delete_many', 'studentIds': studentIds})
+            self._notify([], studentIds)
+        return future, studentIds
+
+    def bulk_delete(self, studentIds: List[str]) -> List[str]:
+        self._sync()
+        future, studentIds = self._bulk_delete(studentIds)
+        future.result()
+        return studentIds
+
+    async def bulk_delete_async(self, studentIds: List[str]) -> List[str]:
+        await self.sync_async()
+        future, studentIds = self._bulk_delete(studentIds)
+        await asyncio.wrap_future(future)
+        return studentIds
+
+    def bulk_delete_where(self, filters: StudentFilter) -> List[str]:
+        self._sync()
+        future, studentIds = self._bulk_delete(None, filters)
+        future.result()
+        return studentIds
+
+    async def bulk_delete_where_async(self, filters: StudentFilter) -> List[str]:
+        await self.sync_async()
+        future, studentIds = self._bulk_delete(None, filters)
+        await asyncio.wrap_future(future)
+        return studentIds
 
     def get(self, studentId: str) -> Any:
-        items = self.read_all()
-        for item in items:
-            if getattr(item, 'studentId', None) == studentId:
-                return item
-        return None
+        self._sync()
+        return self._get(studentId)
+
+    def _get(self, studentId: str) -> Any:
+        with self._lock.read():
+            row = self._items.get(studentId)
+        return self._model(row) if row is not None else None
+
+    async def get_async(self, studentId: str) -> Any:
+        await self.sync_async()
+        return self._get(studentId)
+
+    async def page_async(self, cursor: Optional[str] = None, limit: Optional[int] = None,
+                         filters: Optional[StudentFilter] = None) -> Tuple[List[Any], Optional[str]]:
+        after = self._parse_cursor(cursor)
+        await self.sync_async()
+        return self._page(after, limit, filters)
+
+def create_service(backend: str, data_dir: str, name: str, schema: Type[Any], fieldnames: List[str]) -> StorageService:
+    """Cria o armazenamento ``name`` no backend escolhido (``csv`` ou ``sqlite``)."""
+    if backend == 'csv':
+        return CSVService(os.path.join(data_dir, f'{name}.csv'), schema, fieldnames, journal=True, snapshot=True)
+    if backend == 'sqlite':
+        from app.sqlite_service import SQLiteService
+        return SQLiteService(os.path.join(data_dir, 'students.db'), name, schema, fieldnames)
+    raise ValueError(f'Backend de armazenamento desconhecido: {backend}')
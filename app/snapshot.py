@@ -0,0 +1,121 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Any, List, Optional, Sequence, Tuple
+
+# Formato: MAGIC | tamanho do cabeçalho (uint32) | cabeçalho JSON | colunas.
+# Cada coluna começa num offset múltiplo de 8: inteiros em int64, números em
+# float64 (ordem de bytes nativa, registrada no cabeçalho) e textos em UTF-8
+# separados por '\0'.
+MAGIC = b'SMSNAP01'
+_LENGTH = struct.Struct('<I')
+
+_KINDS = {int: 'q', float: 'd'}
+
+def column_kind(annotation: Any) -> str:
+    """Tipo da coluna binária para a anotação de um campo do schema."""
+    return _KINDS.get(annotation, 's')
+
+def source_stamp(path: str) -> List[int]:
+    """Identifica uma versão do CSV de origem (tamanho, mtime e inode)."""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+def _encode(kind: str, values: Sequence[Any]) -> Optional[bytes]:
+    if kind == 'q':
+        if any(type(value) is not int for value in values):
+            return None
+        return array('q', values).tobytes()
+    if kind == 'd':
+        if any(type(value) not in (int, float) for value in values):
+            return None
+        return array('d', values).tobytes()
+    if any(type(value) is not str or '\0' in value for value in values):
+        return None
+    return '\0'.join(values).encode('utf-8')
+
+def write_snapshot(path: str, fieldnames: List[str], kinds: List[str],
+                   rows: Sequence[Tuple[Any, ...]], source: List[int]) -> bool:
+    """Grava as linhas em formato colunar binário (arquivo temporário + rename).
+
+    Retorna ``False``, sem gravar nada, se algum valor não cabe no tipo da
+    coluna (ex.: inteiro vazio em dados legados); quem lê recorre ao CSV.
+    """
+    blocks = []
+    for i, kind in enumerate(kinds):
+        try:
+            block = _encode(kind, [row[i] for row in rows])
+        except OverflowError:
+            block = None
+        if block is None:
+            return False
+        blocks.append(block)
+    columns = []
+    offset = 0
+    for block in blocks:
+        columns.append([offset, len(block)])
+        offset += len(block) + (-len(block) % 8)
+    header = json.dumps({
+        'fieldnames': fieldnames,
+        'kinds': kinds,
+        'count': len(rows),
+        'byteorder': sys.byteorder,
+        'source': source,
+        'columns': columns,
+    }).encode('utf-8')
+    prefix = MAGIC + _LENGTH.pack(len(header)) + header
+    prefix += b'\0' * (-len(prefix) % 8)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(prefix)
+        for block in blocks:
+            f.write(block + b'\0' * (-len(block) % 8))
+    os.replace(tmp, path)
+    return True
+
+def read_snapshot(path: str, fieldnames: List[str], source: List[int]) -> Optional[List[list]]:
+    """Lê as colunas do snapshot via ``mmap``.
+
+    Retorna ``None`` se o arquivo não existe, está incompleto, foi gerado para
+    outros campos ou não corresponde mais ao CSV de origem (``source``).
+    """
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if size < len(MAGIC) + _LENGTH.size:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(MAGIC)] != MAGIC:
+                return None
+            start = len(MAGIC) + _LENGTH.size
+            (length,) = _LENGTH.unpack_from(mm, len(MAGIC))
+            try:
+                header = json.loads(mm[start:start + length])
+            except ValueError:
+                return None
+            if (header['fieldnames'] != fieldnames or header['source'] != source
+                    or header['byteorder'] != sys.byteorder):
+                return None
+            base = start + length + (-(start + length) % 8)
+            count = header['count']
+            columns = []
+            with memoryview(mm) as view:
+                for kind, (offset, nbytes) in zip(header['kinds'], header['columns']):
+                    begin = base + offset
+                    if begin + nbytes > size:
+                        return None
+                    if kind == 's':
+                        values = bytes(view[begin:begin + nbytes]).decode('utf-8').split('\0') if count else []
+                    else:
+                        with view[begin:begin + nbytes].cast(kind) as column:
+                            values = column.tolist()
+                    if len(values) != count:
+                        return None
+                    columns.append(values)
+            return columns
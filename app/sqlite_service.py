@@ -0,0 +1,468 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+from app.services import (ChangesExpiredError, DuplicateStudentError, StorageService, StudentFilter,
+                          StudentNotFoundError)
+
+# Limite conservador de parâmetros por instrução (SQLITE_MAX_VARIABLE_NUMBER).
+_MAX_PARAMS = 900
+
+_SQL_TYPES = {int: 'INTEGER', float: 'REAL'}
+
+# Campos com índice secundário, quando existirem na tabela.
+_INDEXED = ('major', 'supervisor', 'name', 'age', 'scholarshipAmount')
+
+# Alterações mantidas por tabela no feed; as mais antigas são descartadas a
+# cada ``_PRUNE_EVERY`` escritas na tabela.
+_CHANGES_KEPT = 100_000
+_PRUNE_EVERY = 1000
+
+class SQLiteService(StorageService):
+    """Armazena um tipo de estudante numa tabela SQLite embutida.
+
+    O banco roda em modo WAL (leitores não bloqueiam o escritor) e a tabela tem
+    um índice único em ``studentId``, o que torna as buscas O(log n); os campos
+    usados nos filtros (``major``, ``supervisor``, ``name``, ``age``,
+    ``scholarshipAmount``) também são indexados. A ordem
+    de inserção é preservada pelo ``rowid``. Cada thread usa sua própria
+    conexão; as instruções SQL são fixas e parametrizadas, então o cache de
+    instruções preparadas do ``sqlite3`` é reaproveitado, e os lotes usam
+    ``executemany`` dentro de uma única transação.
+
+    Cada escrita grava também um registro na tabela ``_changes`` (no mesmo
+    formato do log do backend CSV), na mesma transação; o ``seq`` é o rowid
+    desse registro, comum a todas as tabelas do banco.
+    """
+
+    def __init__(self, path: str, table: str, schema: Type[Any], fieldnames: List[str]):
+        super().__init__()
+        self.path = path
+        self.table = table
+        self.schema = schema
+        self.fieldnames = fieldnames
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        columns = ', '.join(f'"{name}"' for name in fieldnames)
+        placeholders = ', '.join('?' for _ in fieldnames)
+        assignments = ', '.join(f'"{name}" = ?' for name in fieldnames)
+        self._select = f'SELECT {columns} FROM "{table}"'
+        self._select_rowid = f'SELECT rowid, {columns} FROM "{table}"'
+        self._insert = f'INSERT INTO "{table}" ({columns}) VALUES ({placeholders})'
+        updates = ', '.join(f'"{name}" = excluded."{name}"' for name in fieldnames)
+        self._upsert = f'{self._insert} ON CONFLICT ("studentId") DO UPDATE SET {updates}'
+        self._update = f'UPDATE "{table}" SET {assignments} WHERE "studentId" = ?'
+        self._delete = f'DELETE FROM "{table}" WHERE "studentId" = ?'
+
+        definitions = ', '.join(f'"{name}" {self._sql_type(name)}' for name in fieldnames)
+        conn = self._conn()
+        with conn:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({definitions})')
+            conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{table}_studentId" ON "{table}" ("studentId")')
+            for name in _INDEXED:
+                if name in fieldnames:
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_{name}" ON "{table}" ("{name}")')
+            # Versão por tabela, incrementada na mesma transação de cada escrita:
+            # vale também para escritas feitas por outros processos.
+            conn.execute('CREATE TABLE IF NOT EXISTS "_versions" ("name" TEXT PRIMARY KEY, "version" INTEGER NOT NULL)')
+            # Colunas acrescentadas depois: bancos antigos são migrados aqui.
+            # ``pruned`` é o maior seq já descartado do feed de alterações.
+            existing = {row[1] for row in conn.execute('PRAGMA table_info("_versions")')}
+            for column, definition in (('modified', 'REAL NOT NULL DEFAULT 0'), ('pruned', 'INTEGER NOT NULL DEFAULT 0')):
+                if column not in existing:
+                    conn.execute(f'ALTER TABLE "_versions" ADD COLUMN "{column}" {definition}')
+            conn.execute('INSERT OR IGNORE INTO "_versions" ("name", "version", "modified") VALUES (?, 0, ?)',
+                         (table, time.time()))
+            conn.execute('CREATE TABLE IF NOT EXISTS "_changes" ("seq" INTEGER PRIMARY KEY AUTOINCREMENT, '
+                         '"name" TEXT NOT NULL, "record" TEXT NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS "_changes_name" ON "_changes" ("name", "seq")')
+        # Último seq já avisado aos listeners (ver ``sync``).
+        self._seen = self._last_seq(conn)[1]
+        self._seen_lock = threading.Lock()
+
+    def _sql_type(self, name: str) -> str:
+        field = self.schema.model_fields.get(name)
+        return _SQL_TYPES.get(field.annotation if field else None, 'TEXT')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _bump(self, conn: sqlite3.Connection, record: Dict[str, Any]):
+        conn.execute('UPDATE "_versions" SET "version" = "version" + 1, "modified" = ? WHERE "name" = ?',
+                     (time.time(), self.table))
+        conn.execute('INSERT INTO "_changes" ("name", "record") VALUES (?, ?)', (self.table, json.dumps(record)))
+        # O seq é comum às tabelas; a versão conta só as escritas desta.
+        version = conn.execute('SELECT "version" FROM "_versions" WHERE "name" = ?', (self.table,)).fetchone()[0]
+        if version % _PRUNE_EVERY == 0:
+            cutoff = conn.execute('SELECT "seq" FROM "_changes" WHERE "name" = ? ORDER BY "seq" DESC LIMIT 1 OFFSET ?',
+                                  (self.table, _CHANGES_KEPT)).fetchone()
+            if cutoff:
+                conn.execute('DELETE FROM "_changes" WHERE "name" = ? AND "seq" <= ?', (self.table, cutoff[0]))
+                conn.execute('UPDATE "_versions" SET "pruned" = ? WHERE "name" = ?', (cutoff[0], self.table))
+
+    @property
+    def version(self) -> int:
+        return self._conn().execute('SELECT "version" FROM "_versions" WHERE "name" = ?', (self.table,)).fetchone()[0]
+
+    @property
+    def modified(self) -> float:
+        return self._conn().execute('SELECT "modified" FROM "_versions" WHERE "name" = ?', (self.table,)).fetchone()[0]
+
+    def _last_seq(self, conn: sqlite3.Connection) -> Tuple[int, int]:
+        return conn.execute('SELECT "pruned", COALESCE((SELECT MAX("seq") FROM "_changes" WHERE "name" = ?), "pruned") '
+                            'FROM "_versions" WHERE "name" = ?', (self.table, self.table)).fetchone()
+
+    @property
+    def seq(self) -> int:
+        last = self._last_seq(self._conn())[1]
+        if last > self._seen:
+            self._catch_up()
+        return last
+
+    def sync(self):
+        conn = self._conn()
+        # Dentro de uma transação desta thread (ex.: importação), o estado
+        # visível já é o da própria transação.
+        if not conn.in_transaction and self._last_seq(conn)[1] > self._seen:
+            self._catch_up()
+
+    def _catch_up(self):
+        # Lê do feed as escritas desde a última vista (inclusive as deste
+        # processo, já avisadas: reaplicá-las no registro não muda nada).
+        with self._seen_lock:
+            try:
+                records, last = self.changes(self._seen)
+            except ChangesExpiredError:
+                records, last = [{'op': 'reset'}], self._last_seq(self._conn())[1]
+            if any(record['op'] == 'reset' for record in records):
+                ids = [row[0] for row in self._conn().execute(f'SELECT "studentId" FROM "{self.table}"')]
+                self._notify(ids, None)
+            else:
+                exists: Dict[str, bool] = {}
+                for record in records:
+                    op = record['op']
+                    if op == 'add':
+                        exists[record['item']['studentId']] = True
+                    elif op in ('add_many', 'upsert_many'):
+                        exists.update((data['studentId'], True) for data in record['items'])
+                    elif op == 'update' and record['item']['studentId'] != record['studentId']:
+                        exists[record['studentId']] = False
+                        exists[record['item']['studentId']] = True
+                    elif op == 'delete':
+                        exists[record['studentId']] = False
+                    elif op == 'delete_many':
+                        exists.update((studentId, False) for studentId in record['studentIds'])
+                self._notify([key for key, value in exists.items() if value],
+                             [key for key, value in exists.items() if not value])
+            self._seen = max(self._seen, last)
+
+    def changes(self, since: int, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        conn = self._conn()
+        with conn:
+            # Uma transação de leitura: o descarte não muda o resultado no meio.
+            conn.execute('BEGIN')
+            pruned, last = self._last_seq(conn)
+            if since < pruned:
+                raise ChangesExpiredError(since, pruned)
+            rows = conn.execute('SELECT "seq", "record" FROM "_changes" WHERE "name" = ? AND "seq" > ? '
+                                'ORDER BY "seq" LIMIT ?', (self.table, since, -1 if limit is None else limit)).fetchall()
+        return [{'seq': seq, **json.loads(record)} for seq, record in rows], last
+
+    def _row(self, item: Any) -> Tuple[Any, ...]:
+        data = item.dict()
+        return tuple(data[name] for name in self.fieldnames)
+
+    def _data(self, item: Any) -> Dict[str, Any]:
+        return dict(zip(self.fieldnames, self._row(item)))
+
+    def _item(self, row: Tuple[Any, ...]) -> Any:
+        # Sem validação: as linhas foram gravadas pelo próprio serviço.
+        return self.schema.model_construct(**dict(zip(self.fieldnames, row)))
+
+    def _where(self, filters: Optional[StudentFilter], after: Optional[int] = None) -> Tuple[str, List[Any]]:
+        clauses: List[str] = []
+        params: List[Any] = []
+        if after is not None:
+            clauses.append('rowid > ?')
+            params.append(after)
+        filters = filters or StudentFilter()
+        for name, value in filters.equals.items():
+            clauses.append(f'"{name}" = ?')
+            params.append(value)
+        for name, (low, high) in filters.ranges.items():
+            if low is not None:
+                clauses.append(f'"{name}" >= ?')
+                params.append(low)
+            if high is not None:
+                clauses.append(f'"{name}" <= ?')
+                params.append(high)
+        for name, prefix in filters.prefixes.items():
+            # Faixa em vez de LIKE para aproveitar o índice (e manter o
+            # prefixo sensível a maiúsculas, como no backend CSV).
+            clauses.append(f'"{name}" >= ? AND "{name}" < ?')
+            params.extend([prefix, prefix + '\U0010ffff'])
+        if not clauses:
+            return '', []
+        return ' WHERE ' + ' AND '.join(clauses), params
+
+    def read_all(self) -> List[Any]:
+        return [self._item(row) for row in self._conn().execute(f'{self._select} ORDER BY rowid')]
+
+    def count(self) -> int:
+        return self._conn().execute(f'SELECT COUNT(*) FROM "{self.table}"').fetchone()[0]
+
+    @staticmethod
+    def _parse_cursor(cursor: Optional[str]) -> Optional[int]:
+        # O cursor é o rowid do último item entregue.
+        if not cursor:
+            return None
+        rowid = int(cursor)
+        if rowid < 0:
+            raise ValueError(f'cursor inválido: {cursor}')
+        return rowid
+
+    def page(self, cursor: Optional[str] = None, limit: Optional[int] = None,
+             filters: Optional[StudentFilter] = None) -> Tuple[List[Any], Optional[str]]:
+        # Busca um item a mais para saber se existe próxima página.
+        fetch = -1 if limit is None else limit + 1
+        where, params = self._where(filters, self._parse_cursor(cursor))
+        rows = self._conn().execute(f'{self._select_rowid}{where} ORDER BY rowid LIMIT ?',
+                                    params + [fetch]).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = str(rows[-1][0])
+        return [self._item(row[1:]) for row in rows], next_cursor
+
+    def iter_items(self, cursor: Optional[str] = None, limit: Optional[int] = None,
+                   filters: Optional[StudentFilter] = None) -> Iterator[Any]:
+        return self._iter_items(self._parse_cursor(cursor), limit, filters)
+
+    def _iter_items(self, after: Optional[int], limit: Optional[int],
+                    filters: Optional[StudentFilter]) -> Iterator[Any]:
+        # O consumidor (ex.: StreamingResponse) pode avançar o gerador em
+        # threads diferentes, então a iteração usa uma conexão própria.
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        try:
+            where, params = self._where(filters, after)
+            cursor = conn.execute(f'{self._select}{where} ORDER BY rowid LIMIT ?',
+                                  params + [-1 if limit is None else limit])
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._item(row)
+        finally:
+            conn.close()
+
+    def iter_rows(self) -> Iterator[Tuple[Any, ...]]:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        try:
+            yield from conn.execute(f'{self._select} ORDER BY rowid')
+        finally:
+            conn.close()
+
+    def get(self, studentId: str) -> Any:
+        row = self._conn().execute(f'{self._select} WHERE "studentId" = ?', (studentId,)).fetchone()
+        return self._item(row) if row else None
+
+    def add(self, item: Any):
+        conn = self._conn()
+        try:
+            with conn:
+                conn.execute(self._insert, self._row(item))
+                self._bump(conn, {'op': 'add', 'item': self._data(item)})
+        except sqlite3.IntegrityError:
+            # Índice único: outra inserção do mesmo studentId chegou antes.
+            raise DuplicateStudentError(item.studentId)
+        self._notify([item.studentId], [])
+
+    def bulk_add(self, items: List[Any]):
+        if not items:
+            return
+        seen = set()
+        for item in items:
+            if item.studentId in seen:
+                raise DuplicateStudentError(item.studentId)
+            seen.add(item.studentId)
+        conn = self._conn()
+        with conn:
+            # BEGIN IMMEDIATE reserva a escrita: ninguém insere os mesmos IDs
+            # entre a verificação e o INSERT.
+            conn.execute('BEGIN IMMEDIATE')
+            existing = self._existing(conn, list(seen))
+            if existing:
+                raise DuplicateStudentError(existing[0])
+            conn.executemany(self._insert, [self._row(item) for item in items])
+            self._bump(conn, {'op': 'add_many', 'items': [self._data(item) for item in items]})
+        self._notify([item.studentId for item in items], [])
+
+    def _existing(self, conn: sqlite3.Connection, ids: List[str]) -> List[str]:
+        found = []
+        for start in range(0, len(ids), _MAX_PARAMS):
+            chunk = ids[start:start + _MAX_PARAMS]
+            marks = ', '.join('?' for _ in chunk)
+            found.extend(row[0] for row in conn.execute(
+                f'SELECT "studentId" FROM "{self.table}" WHERE "studentId" IN ({marks})', chunk))
+        return found
+
+    def bulk_upsert(self, items: List[Any]) -> Tuple[int, int]:
+        if not items:
+            return 0, 0
+        ids = list(dict.fromkeys(item.studentId for item in items))
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            existing = set(self._existing(conn, ids))
+            conn.executemany(self._upsert, [self._row(item) for item in items])
+            self._bump(conn, {'op': 'upsert_many', 'items': [self._data(item) for item in items]})
+        created = [studentId for studentId in ids if studentId not in existing]
+        self._notify(created, [])
+        return len(created), len(items) - len(created)
+
+    def bulk_upsert_chunks(self, chunks: Iterable[List[Any]]) -> Tuple[int, int]:
+        # Uma transação para todos os blocos; cada um vira um registro no feed.
+        created: List[str] = []
+        total = 0
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                ids = list(dict.fromkeys(item.studentId for item in chunk))
+                existing = set(self._existing(conn, ids))
+                conn.executemany(self._upsert, [self._row(item) for item in chunk])
+                self._bump(conn, {'op': 'upsert_many', 'items': [self._data(item) for item in chunk]})
+                created.extend(studentId for studentId in ids if studentId not in existing)
+                total += len(chunk)
+        self._notify(created, [])
+        return len(created), total - len(created)
+
+    def update(self, studentId: str, new_item: Any):
+        conn = self._conn()
+        try:
+            with conn:
+                updated = conn.execute(self._update, self._row(new_item) + (studentId,)).rowcount
+                if updated:
+                    self._bump(conn, {'op': 'update', 'studentId': studentId, 'item': self._data(new_item)})
+        except sqlite3.IntegrityError:
+            # Índice único: o novo studentId já pertence a outro registro.
+            raise DuplicateStudentError(new_item.studentId)
+        if updated and new_item.studentId != studentId:
+            self._notify([new_item.studentId], [studentId])
+
+    def _select_ids(self, conn: sqlite3.Connection, ids: List[str]) -> List[Tuple[Any, ...]]:
+        rows = []
+        for start in range(0, len(ids), _MAX_PARAMS):
+            chunk = ids[start:start + _MAX_PARAMS]
+            marks = ', '.join('?' for _ in chunk)
+            rows.extend(conn.execute(f'{self._select} WHERE "studentId" IN ({marks}) ORDER BY rowid', chunk))
+        return rows
+
+    def _patch_rows(self, conn: sqlite3.Connection, rows: List[Tuple[Any, ...]],
+                    patches: Dict[str, Dict[str, Any]]) -> List[str]:
+        # Chamado dentro da transação: grava os registros completos já alterados.
+        if not rows:
+            return []
+        key = self.fieldnames.index('studentId')
+        data = [{**dict(zip(self.fieldnames, row)), **patches[row[key]]} for row in rows]
+        conn.executemany(self._update, [tuple(item[name] for name in self.fieldnames) + (item['studentId'],)
+                                        for item in data])
+        self._bump(conn, {'op': 'update_many', 'items': data})
+        return [item['studentId'] for item in data]
+
+    def bulk_patch(self, patches: Dict[str, Dict[str, Any]]) -> List[str]:
+        for patch in patches.values():
+            self._check_patch(patch)
+        if not patches:
+            return []
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = self._select_ids(conn, list(patches))
+            if len(rows) < len(patches):
+                found = {row[self.fieldnames.index('studentId')] for row in rows}
+                raise StudentNotFoundError([studentId for studentId in patches if studentId not in found])
+            return self._patch_rows(conn, rows, patches)
+
+    def bulk_patch_where(self, filters: StudentFilter, fields: Dict[str, Any]) -> List[str]:
+        self._check_patch(fields)
+        where, params = self._where(filters)
+        key = self.fieldnames.index('studentId')
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(f'{self._select}{where} ORDER BY rowid', params).fetchall()
+            return self._patch_rows(conn, rows, {row[key]: fields for row in rows})
+
+    def delete(self, studentId: str):
+        conn = self._conn()
+        with conn:
+            deleted = conn.execute(self._delete, (studentId,)).rowcount
+            if deleted:
+                self._bump(conn, {'op': 'delete', 'studentId': studentId})
+        if deleted:
+            self._notify([], [studentId])
+
+    def _delete_ids(self, conn: sqlite3.Connection, ids: List[str]) -> List[str]:
+        if ids:
+            conn.executemany(self._delete, [(studentId,) for studentId in ids])
+            self._bump(conn, {'op': 'delete_many', 'studentIds': ids})
+        return ids
+
+    def bulk_delete(self, studentIds: List[str]) -> List[str]:
+        ids = list(dict.fromkeys(studentIds))
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            existing = set(self._existing(conn, ids))
+            if len(existing) < len(ids):
+                raise StudentNotFoundError([studentId for studentId in ids if studentId not in existing])
+            self._delete_ids(conn, ids)
+        self._notify([], ids)
+        return ids
+
+    def bulk_delete_where(self, filters: StudentFilter) -> List[str]:
+        where, params = self._where(filters)
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            ids = [row[0] for row in conn.execute(f'SELECT "studentId" FROM "{self.table}"{where} ORDER BY rowid', params)]
+            self._delete_ids(conn, ids)
+        self._notify([], ids)
+        return ids
+
+    def write_all(self, items: List[Any]):
+        conn = self._conn()
+        with conn:
+            before = {row[0] for row in conn.execute(f'SELECT "studentId" FROM "{self.table}"')}
+            conn.execute(f'DELETE FROM "{self.table}"')
+            conn.executemany(self._insert, [self._row(item) for item in items])
+            self._bump(conn, {'op': 'reset'})
+        after = {item.studentId for item in items}
+        self._notify(list(after - before), list(before - after))
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+        super().close()
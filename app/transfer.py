@@ -0,0 +1,157 @@
+import csv
+import io
+import json
+import tempfile
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Type
+
+from pydantic import ValidationError
+
+from app.services import StorageService
+
+# Quantos erros de linha são devolvidos (os demais só entram na contagem).
+MAX_REPORTED_ERRORS = 1000
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Linhas válidas por bloco entregue ao armazenamento na importação.
+IMPORT_CHUNK_SIZE = 5000
+
+@dataclass
+class ImportResult:
+    """Erros das linhas descartadas de um CSV importado."""
+
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    error_count: int = 0
+
+    def reject(self, line: int, messages: List[str]):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': messages})
+
+def field_problems(schema: Type[Any], values: Dict[str, Any]) -> List[str]:
+    """Verifica campos já convertidos com as mesmas regras dos handlers:
+    textos obrigatórios e números não negativos."""
+    problems = []
+    for name, value in values.items():
+        annotation = schema.model_fields[name].annotation
+        if annotation is str and not value:
+            problems.append(f'{name}: obrigatório')
+        elif annotation in (int, float) and value < 0:
+            problems.append(f'{name}: não pode ser negativo')
+    return problems
+
+def _problems(item: Any, schema: Type[Any]) -> List[str]:
+    return field_problems(schema, {name: getattr(item, name) for name in schema.model_fields})
+
+def parse_csv(stream: BinaryIO, schema: Type[Any], fieldnames: List[str], result: ImportResult,
+              check: Optional[Callable[[Any], Optional[str]]] = None,
+              chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator[List[Any]]:
+    """Lê e valida um CSV linha a linha, gerando os itens válidos em blocos.
+
+    O cabeçalho deve conter todos os ``fieldnames`` (em qualquer ordem). Cada
+    linha é validada pelo ``schema``, pelas regras dos handlers e por
+    ``check`` (que devolve uma mensagem de erro ou ``None``); linhas inválidas
+    ou com studentId repetido no arquivo são descartadas e reportadas em
+    ``result`` com o número da linha. Só o bloco atual e os studentIds já
+    vistos ficam em memória. Levanta ``ValueError`` se o cabeçalho estiver
+    incompleto ou o arquivo não for UTF-8.
+    """
+    chunk: List[Any] = []
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    seen = set()
+    try:
+        header = next(reader, None)
+        if header is None:
+            return
+        missing = [name for name in fieldnames if name not in header]
+        if missing:
+            raise ValueError(f'Colunas ausentes no cabeçalho: {", ".join(missing)}')
+        for values in reader:
+            if not values:
+                continue
+            if len(values) != len(header):
+                result.reject(reader.line_num, [f'esperadas {len(header)} colunas, encontradas {len(values)}'])
+                continue
+            try:
+                item = schema(**dict(zip(header, values)))
+            except ValidationError as e:
+                result.reject(reader.line_num, [f'{".".join(map(str, error["loc"]))}: {error["msg"]}' for error in e.errors()])
+                continue
+            problems = _problems(item, schema)
+            if item.studentId in seen:
+                problems.append(f'studentId repetido no arquivo: {item.studentId}')
+            elif check is not None:
+                message = check(item)
+                if message:
+                    problems.append(message)
+            if problems:
+                result.reject(reader.line_num, problems)
+                continue
+            seen.add(item.studentId)
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    except UnicodeDecodeError:
+        raise ValueError('O arquivo não está em UTF-8')
+    finally:
+        # Não fecha o arquivo do upload junto com o wrapper.
+        text.detach()
+
+class StagedImport:
+    """Itens já validados de um CSV importado, à espera da escrita.
+
+    Os blocos ficam num arquivo temporário (um JSON por bloco, com os valores
+    na ordem de ``fieldnames``), não na memória; só os studentIds são
+    guardados, para as reservas no registro.
+    """
+
+    def __init__(self, schema: Type[Any], fieldnames: List[str]):
+        self.schema = schema
+        self.fieldnames = fieldnames
+        self.studentIds: List[str] = []
+        self._file = tempfile.TemporaryFile()
+
+    def append(self, chunk: List[Any]):
+        values = [[getattr(item, name) for name in self.fieldnames] for item in chunk]
+        self._file.write(json.dumps(values, ensure_ascii=False).encode('utf-8') + b'\n')
+        self.studentIds.extend(item.studentId for item in chunk)
+
+    def chunks(self) -> Iterator[List[Any]]:
+        """Relê os blocos, sem validar de novo."""
+        self._file.seek(0)
+        for line in self._file:
+            yield [self.schema.model_construct(**dict(zip(self.fieldnames, values))) for values in json.loads(line)]
+
+    def close(self):
+        self._file.close()
+
+def stage_csv(stream: BinaryIO, schema: Type[Any], fieldnames: List[str], result: ImportResult,
+              check: Optional[Callable[[Any], Optional[str]]] = None) -> StagedImport:
+    """Lê e valida o CSV inteiro (ver ``parse_csv``) antes de qualquer escrita,
+    de modo que a transação do armazenamento não espera pelo upload."""
+    staged = StagedImport(schema, fieldnames)
+    try:
+        for chunk in parse_csv(stream, schema, fieldnames, result, check):
+            staged.append(chunk)
+    except BaseException:
+        staged.close()
+        raise
+    return staged
+
+def export_csv(service: StorageService, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Gera o CSV do serviço (cabeçalho + registros) em blocos de ~``chunk_size`` bytes."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(service.fieldnames)
+    for row in service.iter_rows():
+        writer.writerow(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
@@ -0,0 +1,78 @@
+"""Benchmark ponta a ponta da API, executada em processo via ASGI (TestClient).
+
+Popula um diretório de dados temporário, importa ``app.main:app`` apontando
+para ele (``DATA_DIR``) e dispara requisições concorrentes por cenário,
+medindo vazão e latências p50/p99.
+
+Uso:
+    python -m benchmarks.bench_api --size 100000 --requests 2000 --concurrency 16 --output bench_api.json
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+from benchmarks.bench_service import write_dataset
+from benchmarks.common import summarize, write_results
+
+def run_scenario(client, request: Callable[[Any, int], Any], total: int, concurrency: int) -> Dict[str, Any]:
+    def call(i: int) -> Tuple[float, bool]:
+        t0 = time.perf_counter()
+        response = request(client, i)
+        return time.perf_counter() - t0, response.status_code < 400
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        outcomes = list(pool.map(call, range(total)))
+    result = summarize([elapsed for elapsed, _ in outcomes], time.perf_counter() - start)
+    result['errors'] = sum(1 for _, ok in outcomes if not ok)
+    return result
+
+def scenarios(size: int) -> Dict[str, Callable[[Any, int], Any]]:
+    rng = random.Random(size)
+
+    def student(i: int) -> Dict[str, Any]:
+        return {'name': f'Bench {i}', 'age': 20, 'studentId': f'BENCH{i}', 'major': 'Física',
+                'workedDays': 10, 'scholarshipAmount': 700.0}
+
+    return {
+        'get_by_id': lambda c, i: c.get(f'/scientifics/SI{rng.randrange(size)}'),
+        'list_page': lambda c, i: c.get('/scientifics/', params={'limit': 100, 'cursor': rng.randrange(max(size - 100, 1))}),
+        'filter_major': lambda c, i: c.get('/scientifics/', params={'major': 'Física', 'limit': 100}),
+        'lookup': lambda c, i: c.get(f'/lookup/SI{rng.randrange(size)}'),
+        'stats': lambda c, i: c.get('/scientifics/stats', params={'group_by': 'major'}),
+        'create': lambda c, i: c.post('/scientifics/', json=student(i)),
+        'update': lambda c, i: c.put(f'/scientifics/BENCH{i}', json=dict(student(i), scholarshipAmount=800.0)),
+        'delete': lambda c, i: c.delete(f'/scientifics/BENCH{i}'),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', default='csv', choices=['csv', 'sqlite'])
+    parser.add_argument('--size', type=int, default=100000, help='linhas pré-carregadas em scientifics')
+    parser.add_argument('--requests', type=int, default=2000, help='requisições por cenário')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--output', default='bench_api.json')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_dataset(data_dir, args.backend, args.size)
+        os.environ['DATA_DIR'] = data_dir
+        os.environ['STORAGE_BACKEND'] = args.backend
+        start = time.perf_counter()
+        from app.main import app
+        from fastapi.testclient import TestClient
+        startup = time.perf_counter() - start
+
+        results: Dict[str, Any] = {'startup_s': startup}
+        with TestClient(app) as client:
+            # Os cenários rodam em ordem: update e delete usam os IDs criados em create.
+            for name, request in scenarios(args.size).items():
+                results[name] = run_scenario(client, request, args.requests, args.concurrency)
+    write_results(args.output, 'api', vars(args), results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Micro-benchmarks do serviço de armazenamento.
+
+Mede carga inicial, recarga, ``read_all``, ``get``, ``add``, ``update`` e ``delete``
+sobre um arquivo de scientific initiation students com N linhas.
+
+Uso:
+    python -m benchmarks.bench_service --sizes 1000 100000 1000000 --output bench_service.json
+    python -m benchmarks.bench_service --backend sqlite --sizes 1000 100000
+"""
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+from typing import Any, Dict
+
+from app.model.scientific_initiation_student import ScientificInitiationStudent
+from app.services import create_service
+from benchmarks.common import measure, write_results
+
+FIELDNAMES = ['name', 'age', 'studentId', 'major', 'workedDays', 'scholarshipAmount']
+MAJORS = ['Computação', 'Física', 'Matemática', 'Química', 'Biologia']
+
+def make_student(i: int) -> ScientificInitiationStudent:
+    return ScientificInitiationStudent(
+        name=f'Aluno {i}', age=18 + i % 20, studentId=f'SI{i}', major=MAJORS[i % len(MAJORS)],
+        workedDays=i % 365, scholarshipAmount=float(400 + i % 1200),
+    )
+
+def write_dataset(data_dir: str, backend: str, size: int):
+    if backend == 'csv':
+        # Escreve o CSV direto: o tempo de preparação não entra na medição.
+        with open(os.path.join(data_dir, 'scientifics.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDNAMES)
+            for i in range(size):
+                writer.writerow([f'Aluno {i}', 18 + i % 20, f'SI{i}', MAJORS[i % len(MAJORS)], i % 365, float(400 + i % 1200)])
+    else:
+        service = create_service(backend, data_dir, 'scientifics', ScientificInitiationStudent, FIELDNAMES)
+        service.write_all([make_student(i) for i in range(size)])
+        service.close()
+
+def bench_size(backend: str, size: int, repeat: int, read_all_repeat: int) -> Dict[str, Any]:
+    rng = random.Random(size)
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_dataset(data_dir, backend, size)
+        start = time.perf_counter()
+        service = create_service(backend, data_dir, 'scientifics', ScientificInitiationStudent, FIELDNAMES)
+        results: Dict[str, Any] = {'load_s': time.perf_counter() - start}
+        # Segunda carga: no backend CSV já encontra o snapshot binário.
+        service.close()
+        start = time.perf_counter()
+        service = create_service(backend, data_dir, 'scientifics', ScientificInitiationStudent, FIELDNAMES)
+        results['reload_s'] = time.perf_counter() - start
+
+        results['read_all'] = measure(lambda i: service.read_all(), read_all_repeat)
+        results['get'] = measure(lambda i: service.get(f'SI{rng.randrange(size)}'), repeat)
+        results['add'] = measure(lambda i: service.add(make_student(size + i)), repeat)
+        updates = [make_student(rng.randrange(size)) for _ in range(repeat)]
+        results['update'] = measure(lambda i: service.update(updates[i].studentId, updates[i]), repeat)
+        victims = rng.sample(range(size), min(repeat, size))
+        results['delete'] = measure(lambda i: service.delete(f'SI{victims[i]}'), len(victims))
+        service.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', default='csv', choices=['csv', 'sqlite'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=200, help='operações por medição de get/add/update/delete')
+    parser.add_argument('--read-all-repeat', type=int, default=5)
+    parser.add_argument('--output', default='bench_service.json')
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes:
+        results[str(size)] = bench_size(args.backend, size, args.repeat, args.read_all_repeat)
+    write_results(args.output, 'service', vars(args), results)
+
+if __name__ == '__main__':
+    main()
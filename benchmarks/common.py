@@ -0,0 +1,55 @@
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+def percentile(values: List[float], p: float) -> float:
+    """Percentil por vizinho mais próximo de uma lista já ordenada."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, Any]:
+    """Resume latências (em segundos) em milissegundos e operações por segundo."""
+    ordered = sorted(latencies)
+    count = len(ordered)
+    return {
+        'count': count,
+        'mean_ms': sum(ordered) / count * 1000 if count else 0.0,
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'max_ms': ordered[-1] * 1000 if count else 0.0,
+        'ops_per_s': count / elapsed if elapsed else 0.0,
+    }
+
+def measure(fn: Callable[[int], Any], repeat: int) -> Dict[str, Any]:
+    """Executa ``fn(i)`` ``repeat`` vezes e resume as latências."""
+    latencies = []
+    start = time.perf_counter()
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - start)
+
+def metadata() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+    }
+
+def write_results(path: str, benchmark: str, params: Dict[str, Any], results: Any):
+    payload = {'benchmark': benchmark, 'metadata': metadata(), 'params': params, 'results': results}
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    print(json.dumps(payload, indent=2))
@@ -0,0 +1,137 @@
+import importlib
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+@pytest.fixture(params=['csv', 'sqlite'])
+def api(request, tmp_path, monkeypatch):
+    """Importa ``app.main`` com ``DATA_DIR`` num diretório temporário, em cada
+    backend, e fecha os serviços ao fim do teste."""
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    monkeypatch.setenv('STORAGE_BACKEND', request.param)
+    sys.modules.pop('app.main', None)
+    main = importlib.import_module('app.main')
+    with TestClient(main.app) as client:
+        yield main, client
+    for service in (main.student_service, main.undergrad_service, main.scientific_service, main.postgrad_service):
+        service.close()
+    sys.modules.pop('app.main', None)
+
+@pytest.fixture
+def client(api):
+    return api[1]
+
+def add_students(client, *ages):
+    students = [{'name': f'Aluno {i}', 'age': age, 'studentId': f'S{i}'} for i, age in enumerate(ages)]
+    assert client.post('/students/batch', json=students).status_code == 200
+
+def ages(client):
+    return {item['studentId']: item['age'] for item in client.get('/students/').json()}
+
+def test_patch_batch_is_all_or_nothing(client):
+    add_students(client, 20, 21)
+    r = client.patch('/students/batch', json={'items': [{'studentId': 'S0', 'age': 30}, {'studentId': 'NOPE', 'age': 31}]})
+    assert r.status_code == 404
+    assert ages(client) == {'S0': 20, 'S1': 21}
+    r = client.patch('/students/batch', json={'items': [{'studentId': 'S0', 'age': 30}, {'studentId': 'S1', 'name': 'Bia'}]})
+    assert r.status_code == 200
+    assert r.json() == {'updated': 2, 'studentIds': ['S0', 'S1']}
+    assert client.get('/students/S1').json() == {'name': 'Bia', 'age': 21, 'studentId': 'S1'}
+
+def test_patch_batch_rejects_ambiguous_bodies(client):
+    add_students(client, 20)
+    both = {'items': [{'studentId': 'S0', 'age': 30}], 'fields': {'age': 30}}
+    assert client.patch('/students/batch', json=both).status_code == 422
+    assert client.patch('/students/batch', json={}).status_code == 422
+    # "fields" sem filtro alteraria todos os registros.
+    assert client.patch('/students/batch', json={'fields': {'age': 30}}).status_code == 422
+    assert ages(client) == {'S0': 20}
+
+def test_patch_batch_refuses_to_change_student_id(client):
+    add_students(client, 20)
+    r = client.patch('/students/batch', params={'max_age': 30}, json={'fields': {'studentId': 'X'}})
+    assert r.status_code == 422
+    r = client.patch('/students/batch', json={'items': [{'studentId': 'S0', 'age': -1}]})
+    assert r.status_code == 422
+    assert client.get('/students/S0').json()['age'] == 20
+    assert client.get('/students/X').status_code == 404
+
+def test_patch_and_delete_by_filter(client):
+    add_students(client, 15, 16, 30, 40)
+    r = client.patch('/students/batch', params={'max_age': 17}, json={'fields': {'age': 18}})
+    assert r.json() == {'updated': 2, 'studentIds': ['S0', 'S1']}
+    assert ages(client) == {'S0': 18, 'S1': 18, 'S2': 30, 'S3': 40}
+    r = client.request('DELETE', '/students/batch', params={'min_age': 30})
+    assert r.json() == {'deleted': 2, 'studentIds': ['S2', 'S3']}
+    assert ages(client) == {'S0': 18, 'S1': 18}
+
+def test_delete_batch_is_all_or_nothing(client):
+    add_students(client, 20, 21, 22)
+    r = client.request('DELETE', '/students/batch', json={'studentIds': ['S0', 'NOPE']})
+    assert r.status_code == 404
+    assert ages(client) == {'S0': 20, 'S1': 21, 'S2': 22}
+    assert client.request('DELETE', '/students/batch').status_code == 422
+    r = client.request('DELETE', '/students/batch', params={'max_age': 30}, json={'studentIds': ['S0']})
+    assert r.status_code == 422
+    r = client.request('DELETE', '/students/batch', json={'studentIds': ['S0', 'S2']})
+    assert r.json() == {'deleted': 2, 'studentIds': ['S0', 'S2']}
+    assert ages(client) == {'S1': 21}
+
+def test_import_and_export(api):
+    main, client = api
+    client.post('/undergraduates/', json={'name': 'Outro', 'age': 30, 'studentId': 'U1', 'major': 'M'})
+    add_students(client, 20)
+    seq = main.student_service.seq
+    csv_text = ('﻿studentId,name,age\r\n'
+                'S0,"Ana, B",21\r\n'
+                'S1,Bia,abc\r\n'
+                'S2,Caio,22\r\n'
+                'S2,Caio,22\r\n'
+                'U1,Dora,23\r\n')
+    r = client.post('/students/import', files={'file': ('a.csv', csv_text.encode('utf-8'), 'text/csv')})
+    assert r.status_code == 200
+    body = r.json()
+    assert (body['created'], body['updated'], body['errorCount']) == (1, 1, 3)
+    assert ages(client) == {'S0': 21, 'S2': 22}
+    assert client.get('/students/S0').json()['name'] == 'Ana, B'
+    # A importação entra no feed como registros upsert_many, não como reset.
+    changes = client.get('/changes', params={'resource': 'students', 'since': seq}).json()['changes']
+    assert {change['op'] for change in changes} == {'upsert_many'}
+
+    r = client.get('/students/export')
+    assert r.headers['content-disposition'] == 'attachment; filename="students.csv"'
+    assert int(r.headers['x-change-seq']) == main.student_service.seq
+    assert r.text.splitlines() == ['name,age,studentId', '"Ana, B",21,S0', 'Caio,22,S2']
+
+    r = client.post('/students/import', files={'file': ('b.csv', b'name,age\r\nA,1\r\n', 'text/csv')})
+    assert r.status_code == 422
+    r = client.post('/students/import', files={'file': ('c.csv', b'name,age,studentId\r\n\xe9\xff,1,S9\r\n', 'text/csv')})
+    assert r.status_code == 422
+    assert ages(client) == {'S0': 21, 'S2': 22}
+
+def test_list_etag_and_not_modified(client):
+    add_students(client, 20)
+    r = client.get('/students/')
+    etag, modified = r.headers['etag'], r.headers['last-modified']
+    assert client.get('/students/', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/students/', headers={'If-Modified-Since': modified}).status_code == 304
+    client.post('/students/', json={'name': 'Novo', 'age': 22, 'studentId': 'N1'})
+    r = client.get('/students/', headers={'If-None-Match': etag})
+    assert r.status_code == 200
+    assert r.headers['etag'] != etag
+
+def test_item_etag_and_not_modified(client):
+    add_students(client, 20, 21)
+    r = client.get('/students/S0')
+    etag = r.headers['etag']
+    assert client.get('/students/S0', headers={'If-None-Match': etag}).status_code == 304
+    # A ETag de um item não vale para outro, nem a da listagem para um item.
+    assert client.get('/students/S1', headers={'If-None-Match': etag}).status_code == 200
+    list_etag = client.get('/students/').headers['etag']
+    assert client.get('/students/S0', headers={'If-None-Match': list_etag}).status_code == 200
+    # studentId inexistente é 404 mesmo com cabeçalhos condicionais que casariam.
+    assert client.get('/students/NOPE', headers={'If-None-Match': list_etag}).status_code == 404
+    assert client.get('/students/NOPE', headers={'If-None-Match': '*'}).status_code == 404
+    modified = r.headers['last-modified']
+    assert client.get('/students/NOPE', headers={'If-Modified-Since': modified}).status_code == 404
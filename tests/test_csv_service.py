@@ -0,0 +1,127 @@
+import os
+import threading
+
+import pytest
+
+from app.model.student import Student
+from app.services import CSVService
+
+FIELDNAMES = ['name', 'age', 'studentId']
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / 'students.csv'
+    path.write_text(','.join(FIELDNAMES) + '\n')
+    return str(path)
+
+@pytest.fixture
+def open_service(csv_path):
+    """Abre instâncias de CSVService sobre o mesmo arquivo (como workers) e as
+    fecha ao fim do teste."""
+    services = []
+
+    def open_service(**options):
+        options.setdefault('journal', True)
+        service = CSVService(csv_path, Student, FIELDNAMES, **options)
+        services.append(service)
+        return service
+
+    yield open_service
+    for service in services:
+        service.close()
+
+def student(i, age=20):
+    return Student(name=f'Aluno {i}', age=age, studentId=f'S{i}')
+
+def ids(service):
+    return [item.studentId for item in service.read_all()]
+
+def test_restart_replays_journal(open_service):
+    service = open_service()
+    service.bulk_add([student(i) for i in range(5)])
+    service.update('S1', student(1, age=30))
+    service.delete('S3')
+    service.close()
+
+    reopened = open_service()
+    assert ids(reopened) == ['S0', 'S1', 'S2', 'S4']
+    assert reopened.get('S1').age == 30
+    assert reopened.seq == service.seq
+
+def test_torn_tail_is_truncated_on_startup(open_service, csv_path):
+    service = open_service()
+    service.add(student(1))
+    service.add(student(2))
+    service.close()
+    journal = csv_path + '.log'
+    size = os.path.getsize(journal)
+    with open(journal, 'ab') as f:
+        f.write(b'{"op": "add", "item": {"name": "Aluno 3"')
+
+    reopened = open_service()
+    assert ids(reopened) == ['S1', 'S2']
+    assert os.path.getsize(journal) == size
+    reopened.add(student(3))
+    reopened.close()
+    assert ids(open_service()) == ['S1', 'S2', 'S3']
+
+def test_catch_up_applies_other_instance_writes(open_service):
+    first = open_service()
+    second = open_service()
+    changes = []
+    second.subscribe(lambda added, removed: changes.append((sorted(added), removed and sorted(removed))))
+
+    first.bulk_add([student(i) for i in range(3)])
+    first.update('S0', Student(name='Renomeado', age=21, studentId='S9'))
+    first.delete('S1')
+
+    assert ids(second) == ['S9', 'S2']
+    assert second.get('S9').name == 'Renomeado'
+    assert second.seq == first.seq
+    assert changes == [(['S2', 'S9'], [])]
+    # Depois de alcançar, a escrita local continua a numeração do log.
+    second.add(student(5))
+    assert ids(first) == ['S9', 'S2', 'S5']
+    assert first.revision == second.revision
+
+def test_compaction_while_other_instance_writes(open_service):
+    compacting = open_service(compact_threshold=512)
+    writer = open_service()
+    done = threading.Event()
+
+    def write():
+        for i in range(300):
+            writer.add(student(i))
+        done.set()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    while not done.is_set():
+        compacting.compact()
+    thread.join()
+
+    expected = [f'S{i}' for i in range(300)]
+    assert ids(writer) == expected
+    assert ids(compacting) == expected
+    compacting.close()
+    writer.close()
+    assert ids(open_service()) == expected
+
+def test_write_failure_rolls_back_memory(open_service, monkeypatch):
+    service = open_service()
+    other = open_service()
+    service.add(student(1))
+
+    def fail(records):
+        raise OSError('disco cheio')
+
+    monkeypatch.setattr(service, '_append_journal', fail)
+    with pytest.raises(OSError):
+        service.add(student(2))
+    assert ids(service) == ['S1']
+    assert service.get('S2') is None
+
+    monkeypatch.undo()
+    service.add(student(3))
+    assert ids(service) == ['S1', 'S3']
+    assert ids(other) == ['S1', 'S3']
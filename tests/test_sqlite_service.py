@@ -0,0 +1,109 @@
+import pytest
+
+from app import sqlite_service
+from app.model.scientific_initiation_student import ScientificInitiationStudent
+from app.model.student import Student
+from app.services import ChangesExpiredError, DuplicateStudentError, StudentFilter
+from app.sqlite_service import SQLiteService
+
+FIELDNAMES = ['name', 'age', 'studentId']
+
+@pytest.fixture
+def open_service(tmp_path):
+    """Abre instâncias de SQLiteService sobre o mesmo banco (como workers) e
+    as fecha ao fim do teste."""
+    services = []
+
+    def open_service(table='students', schema=Student, fieldnames=FIELDNAMES):
+        service = SQLiteService(str(tmp_path / 'students.db'), table, schema, fieldnames)
+        services.append(service)
+        return service
+
+    yield open_service
+    for service in services:
+        service.close()
+
+def student(i, age=20):
+    return Student(name=f'Aluno {i}', age=age, studentId=f'S{i}')
+
+def ids(service):
+    return [item.studentId for item in service.read_all()]
+
+def test_bulk_add_is_all_or_nothing(open_service):
+    service = open_service()
+    service.add(student(1))
+    version = service.version
+    with pytest.raises(DuplicateStudentError) as error:
+        service.bulk_add([student(2), student(1), student(3)])
+    assert error.value.studentId == 'S1'
+    assert ids(service) == ['S1']
+    assert service.version == version
+    with pytest.raises(DuplicateStudentError):
+        service.bulk_add([student(4), student(4)])
+    assert ids(service) == ['S1']
+
+def test_integrity_errors_become_duplicate_errors(open_service):
+    service = open_service()
+    service.bulk_add([student(1), student(2)])
+    with pytest.raises(DuplicateStudentError):
+        service.add(student(1))
+    with pytest.raises(DuplicateStudentError) as error:
+        service.update('S1', student(2, age=50))
+    assert error.value.studentId == 'S2'
+    assert service.get('S1').age == 20
+    assert service.get('S2').age == 20
+
+def test_pruned_changes_raise_expired(open_service, monkeypatch):
+    monkeypatch.setattr(sqlite_service, '_CHANGES_KEPT', 3)
+    monkeypatch.setattr(sqlite_service, '_PRUNE_EVERY', 5)
+    service = open_service()
+    for i in range(5):
+        service.add(student(i))
+    records, last = service.changes(2)
+    assert [record['seq'] for record in records] == [3, 4, 5]
+    assert last == 5
+    with pytest.raises(ChangesExpiredError) as error:
+        service.changes(1)
+    assert error.value.oldest == 2
+    # A poda é por tabela: escritas em outra tabela não descartam estas.
+    other = open_service('scientifics', ScientificInitiationStudent,
+                         ['name', 'age', 'studentId', 'major', 'workedDays', 'scholarshipAmount'])
+    for i in range(5):
+        other.add(ScientificInitiationStudent(name='X', age=20, studentId=f'X{i}', major='F',
+                                              workedDays=1, scholarshipAmount=1.0))
+    assert [record['seq'] for record in service.changes(2)[0]] == [3, 4, 5]
+
+def test_rowid_cursor_survives_concurrent_writes(open_service):
+    service = open_service()
+    service.bulk_add([student(i, age=20 + i) for i in range(6)])
+    items, cursor = service.page(None, 2)
+    assert [item.studentId for item in items] == ['S0', 'S1']
+    service.delete('S1')
+    service.delete('S2')
+    service.add(student(9))
+    items, cursor = service.page(cursor, 2)
+    assert [item.studentId for item in items] == ['S3', 'S4']
+    items, cursor = service.page(cursor, 2)
+    assert [item.studentId for item in items] == ['S5', 'S9']
+    assert cursor is None
+    filters = StudentFilter(ranges={'age': (23, None)})
+    items, cursor = service.page(None, 1, filters)
+    assert [item.studentId for item in service.iter_items(cursor, None, filters)] == ['S4', 'S5']
+    with pytest.raises(ValueError):
+        service.page('x')
+    with pytest.raises(ValueError):
+        service.iter_items('-1')
+
+def test_sync_notifies_other_instance_writes(open_service):
+    first = open_service()
+    second = open_service()
+    notified = []
+    second.subscribe(lambda added, removed: notified.append((sorted(added), removed and sorted(removed))))
+
+    first.bulk_add([student(1), student(2)])
+    first.update('S1', Student(name='Renomeado', age=20, studentId='S5'))
+    first.delete('S2')
+    second.sync()
+    assert notified == [(['S5'], ['S1', 'S2'])]
+    second.sync()
+    assert len(notified) == 1